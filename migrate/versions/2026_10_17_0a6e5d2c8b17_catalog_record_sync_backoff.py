@@ -0,0 +1,35 @@
+"""Add catalog_record next_attempt_at and sync-due index
+
+Revision ID: 0a6e5d2c8b17
+Revises: f19c3a7e0b42
+Create Date: 2026-10-17 19:44:52.108336
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6e5d2c8b17'
+down_revision = 'f19c3a7e0b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a null next_attempt_at means due immediately, so existing
+    # unsynced entries are retried on the next run
+    op.execute('ALTER TABLE catalog_record ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE')
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_record_sync_due '
+            'ON catalog_record (catalog_id, next_attempt_at) WHERE NOT synced'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_catalog_record_sync_due')
+
+    op.drop_column('catalog_record', 'next_attempt_at')
@@ -0,0 +1,72 @@
+"""Guard embargo_schedule trigger functions against malformed dates
+
+Revision ID: 3c8e5f0a1d92
+Revises: b52c09e7f3a8
+Create Date: 2026-10-17 21:12:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e5f0a1d92'
+down_revision = 'b52c09e7f3a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # replaces the functions created with the embargo_schedule table;
+    # the triggers themselves are unchanged
+    op.execute(r'''
+-- embargo dates are not validated by the tag schema, so a malformed
+-- date is treated as absent rather than failing the tag write
+CREATE OR REPLACE FUNCTION embargo_schedule_date(value text) RETURNS date AS $$
+BEGIN
+    IF value !~ '^\d{4}-\d{2}-\d{2}$' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::date;
+EXCEPTION WHEN datetime_field_overflow OR invalid_datetime_format THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE OR REPLACE FUNCTION embargo_schedule_record_tag() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM embargo_schedule WHERE record_tag_id = NEW.id;
+    IF NEW.tag_id = 'Record.Embargo' THEN
+        INSERT INTO embargo_schedule (catalog_id, record_tag_id, date, record_id)
+        SELECT catalog.id, NEW.id, transition.date, NEW.record_id
+        FROM catalog, (VALUES
+            (embargo_schedule_date(NEW.data->>'start')),
+            (embargo_schedule_date(NEW.data->>'end') + 1)
+        ) AS transition (date)
+        WHERE transition.date > current_date
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION embargo_schedule_catalog() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO embargo_schedule (catalog_id, record_tag_id, date, record_id)
+    SELECT NEW.id, record_tag.id, transition.date, record_tag.record_id
+    FROM record_tag, LATERAL (VALUES
+        (embargo_schedule_date(record_tag.data->>'start')),
+        (embargo_schedule_date(record_tag.data->>'end') + 1)
+    ) AS transition (date)
+    WHERE record_tag.tag_id = 'Record.Embargo'
+    AND transition.date > current_date
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+''')
+
+
+def downgrade():
+    # the guarded functions are compatible with the previous schema
+    pass
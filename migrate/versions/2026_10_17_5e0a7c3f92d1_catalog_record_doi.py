@@ -0,0 +1,40 @@
+"""Add indexed DOI column to catalog_record
+
+Revision ID: 5e0a7c3f92d1
+Revises: bd24d129f13e
+Create Date: 2026-10-17 11:40:07.193552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0a7c3f92d1'
+down_revision = 'bd24d129f13e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('ALTER TABLE catalog_record ADD COLUMN IF NOT EXISTS doi VARCHAR')
+
+    # the publisher only rewrites entries whose published form changes,
+    # so existing entries are filled in here
+    op.execute(
+        "UPDATE catalog_record SET doi = published_record->>'doi' "
+        "WHERE published AND doi IS DISTINCT FROM published_record->>'doi'"
+    )
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_record_catalog_id_doi '
+            'ON catalog_record (catalog_id, doi)'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_catalog_record_catalog_id_doi')
+
+    op.drop_column('catalog_record', 'doi')
@@ -0,0 +1,28 @@
+"""Add catalog_record published_md5
+
+Revision ID: 7d3f1b9a4e65
+Revises: 0a6e5d2c8b17
+Create Date: 2026-10-17 19:52:30.774905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3f1b9a4e65'
+down_revision = '0a6e5d2c8b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('ALTER TABLE catalog_record ADD COLUMN IF NOT EXISTS published_md5 VARCHAR')
+
+    # the published form of an unpublished entry is null; published entries
+    # are left without a hash, and are rewritten once when next evaluated
+    op.execute("UPDATE catalog_record SET published_md5 = md5('null') WHERE NOT published AND published_md5 IS NULL")
+
+
+def downgrade():
+    op.drop_column('catalog_record', 'published_md5')
@@ -0,0 +1,68 @@
+"""Add catalog_record change time and tombstones for the change feed
+
+Revision ID: a31f6d08c5b7
+Revises: 5e0a7c3f92d1
+Create Date: 2026-10-17 14:02:55.861340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a31f6d08c5b7'
+down_revision = '5e0a7c3f92d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('ALTER TABLE catalog_record ADD COLUMN IF NOT EXISTS changed TIMESTAMP WITH TIME ZONE')
+
+    # existing entries enter the change feed at the time of their latest record change
+    op.execute('UPDATE catalog_record SET changed = timestamp WHERE changed IS NULL')
+
+    op.execute('''
+CREATE TABLE IF NOT EXISTS catalog_record_tombstone (
+    catalog_id VARCHAR NOT NULL,
+    record_id VARCHAR NOT NULL,
+    doi VARCHAR,
+    changed TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (catalog_id, record_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_catalog_record_tombstone_catalog_id_changed
+ON catalog_record_tombstone (catalog_id, changed);
+
+CREATE OR REPLACE FUNCTION catalog_record_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO catalog_record_tombstone (catalog_id, record_id, doi, changed)
+    VALUES (OLD.catalog_id, OLD.record_id, OLD.doi, statement_timestamp())
+    ON CONFLICT (catalog_id, record_id) DO UPDATE
+    SET doi = excluded.doi, changed = excluded.changed;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS catalog_record_tombstone ON catalog_record;
+
+CREATE TRIGGER catalog_record_tombstone
+AFTER DELETE ON catalog_record
+FOR EACH ROW EXECUTE FUNCTION catalog_record_tombstone();
+''')
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_record_catalog_id_changed '
+            'ON catalog_record (catalog_id, changed)'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_catalog_record_catalog_id_changed')
+
+    op.execute('DROP TRIGGER IF EXISTS catalog_record_tombstone ON catalog_record')
+    op.execute('DROP FUNCTION IF EXISTS catalog_record_tombstone()')
+    op.drop_table('catalog_record_tombstone')
+    op.drop_column('catalog_record', 'changed')
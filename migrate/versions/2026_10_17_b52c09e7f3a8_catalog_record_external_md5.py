@@ -0,0 +1,26 @@
+"""Add catalog_record external_md5
+
+Revision ID: b52c09e7f3a8
+Revises: 7d3f1b9a4e65
+Create Date: 2026-10-17 20:06:19.352871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52c09e7f3a8'
+down_revision = '7d3f1b9a4e65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # hashes of existing synced entries are recorded by the
+    # next reconciliation (publish/main.py --reconcile)
+    op.execute('ALTER TABLE catalog_record ADD COLUMN IF NOT EXISTS external_md5 VARCHAR')
+
+
+def downgrade():
+    op.drop_column('catalog_record', 'external_md5')
@@ -0,0 +1,31 @@
+"""Add GIN index on catalog_record.full_text
+
+Revision ID: bd24d129f13e
+Revises:
+Create Date: 2026-10-17 09:12:41.508214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bd24d129f13e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # build the index without blocking writes by the publisher; the index
+    # already exists on databases created with systemdata.py
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_record_full_text '
+            'ON catalog_record USING gin (full_text)'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_catalog_record_full_text')
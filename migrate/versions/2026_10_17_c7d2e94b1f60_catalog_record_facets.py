@@ -0,0 +1,40 @@
+"""Add catalog_record facets column and GIN indexes for faceted search
+
+Revision ID: c7d2e94b1f60
+Revises: a31f6d08c5b7
+Create Date: 2026-10-17 16:25:13.472019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e94b1f60'
+down_revision = 'a31f6d08c5b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keywords and facets of existing entries are filled in by
+    # running the publisher with --reindex
+    op.execute('ALTER TABLE catalog_record ADD COLUMN IF NOT EXISTS facets VARCHAR[]')
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_record_keywords '
+            'ON catalog_record USING gin (keywords)'
+        )
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_record_facets '
+            'ON catalog_record USING gin (facets)'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_catalog_record_facets')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_catalog_record_keywords')
+
+    op.drop_column('catalog_record', 'facets')
@@ -0,0 +1,32 @@
+"""Add GiST index on the catalog_record spatial extent
+
+Revision ID: e4b8a1d63c29
+Revises: c7d2e94b1f60
+Create Date: 2026-10-17 18:07:46.915283
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8a1d63c29'
+down_revision = 'c7d2e94b1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # spatial extents of existing entries are filled in by
+    # running the publisher with --reindex
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_record_spatial_extent '
+            'ON catalog_record USING gist '
+            '(box(point(spatial_west, spatial_south), point(spatial_east, spatial_north)))'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_catalog_record_spatial_extent')
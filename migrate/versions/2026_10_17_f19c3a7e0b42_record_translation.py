@@ -0,0 +1,28 @@
+"""Add record translation columns
+
+Revision ID: f19c3a7e0b42
+Revises: e4b8a1d63c29
+Create Date: 2026-10-17 19:31:08.640217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f19c3a7e0b42'
+down_revision = 'e4b8a1d63c29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing records have no stored translation, and are translated
+    # by the publisher until they are next updated
+    op.execute('ALTER TABLE record ADD COLUMN IF NOT EXISTS translation JSONB')
+    op.execute('ALTER TABLE record ADD COLUMN IF NOT EXISTS translation_md5 VARCHAR')
+
+
+def downgrade():
+    op.drop_column('record', 'translation_md5')
+    op.drop_column('record', 'translation')
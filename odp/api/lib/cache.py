@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+
+from odplib.config import config
+
+
+def cache_headers(etag: Optional[str], last_modified: Optional[datetime]) -> dict[str, str]:
+    """Return the headers with which a cacheable published resource
+    is to be served.
+
+    :param etag: quoted entity tag, e.g. a content hash
+    :param last_modified: time of the latest change to the resource
+    """
+    headers = {'Cache-Control': f'public, max-age={config.ODP.API.CACHE_MAX_AGE}'}
+    if etag:
+        headers['ETag'] = etag
+    if last_modified:
+        headers['Last-Modified'] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(request: Request, etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    """Evaluate the conditional request headers, returning True if the
+    client's cached copy of the resource is current and a 304 (Not
+    Modified) response may be returned.
+
+    If-Modified-Since is only considered in the absence of If-None-Match
+    (RFC 9110, section 13.1.3).
+    """
+    if (if_none_match := request.headers.get('If-None-Match')) is not None:
+        if not etag:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        return _weak(etag) in (_weak(tag.strip()) for tag in if_none_match.split(','))
+
+    if (if_modified_since := request.headers.get('If-Modified-Since')) is not None and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def _weak(etag: str) -> str:
+    """Strip the weakness indicator from an entity tag, for the weak
+    comparison required by If-None-Match."""
+    return etag.removeprefix('W/')
@@ -1,8 +1,33 @@
 from pydantic import constr
+from sqlalchemy import func, literal_column, select, union_all
+from sqlalchemy.sql import Subquery
 
+from odp.db.models import CatalogRecord
 from odplib.config import config
 from odplib.const import DOI_REGEX
 
 
 async def get_catalog_ui_url(doi: constr(regex=DOI_REGEX)) -> str:
     return f'{config.ODP.API.CATALOG_UI_URL}/{doi}'
+
+
+def facet_counts(*conditions) -> Subquery:
+    """Return a (facet, value, count) subquery counting the catalog
+    records matching `conditions` by facet value. Keyword values are
+    counted under the 'keyword' facet."""
+    facet_values = union_all(
+        select(func.unnest(CatalogRecord.facets).label('value')).
+        where(*conditions),
+        select(literal_column("'keyword:'").op('||')(func.unnest(CatalogRecord.keywords)).label('value')).
+        where(*conditions),
+    ).subquery()
+
+    return (
+        select(
+            func.split_part(facet_values.c.value, ':', 1).label('facet'),
+            func.substr(facet_values.c.value, func.strpos(facet_values.c.value, ':') + 1).label('value'),
+            func.count().label('count'),
+        ).
+        group_by(facet_values.c.value).
+        subquery()
+    )
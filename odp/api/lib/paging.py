@@ -1,13 +1,20 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from enum import Enum
 from math import ceil
-from typing import Callable, Generic, List, TypeVar
+from typing import Any, Callable, Generic, List, Optional, Sequence, TypeVar
 
 from fastapi import HTTPException, Query
 from pydantic import BaseModel
 from pydantic.generics import GenericModel
-from sqlalchemy import func, select, text
+from sqlalchemy import and_, false, func, inspect, or_, select, text, tuple_
 from sqlalchemy.engine import Row
-from sqlalchemy.exc import CompileError
-from sqlalchemy.sql import Select
+from sqlalchemy.exc import CompileError, NoInspectionAvailable
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import ClauseElement, ColumnElement, Executable, Select
 from starlette.status import HTTP_422_UNPROCESSABLE_ENTITY
 
 from odp.db import Base, Session
@@ -17,9 +24,16 @@ ModelT = TypeVar('ModelT', bound=BaseModel)
 
 class Page(GenericModel, Generic[ModelT]):
     items: List[ModelT]
-    total: int
+    total: Optional[int]
     page: int
-    pages: int
+    pages: Optional[int]
+    next_cursor: Optional[str]
+
+
+class TotalMode(str, Enum):
+    EXACT = 'exact'
+    ESTIMATE = 'estimate'
+    NONE = 'none'
 
 
 class Paginator:
@@ -28,10 +42,16 @@ class Paginator:
             page: int = Query(1, ge=1, description='Page number'),
             size: int = Query(50, ge=0, description='Page size (0 = unlimited)'),
             sort: str = Query('id', description='Sort column'),
+            cursor: str = Query(None, description='Continue from the `next_cursor` of a previous page '
+                                                  '(overrides page number)'),
+            total: TotalMode = Query(TotalMode.EXACT, description='Total count: exact, estimated '
+                                                                  'from planner statistics, or none'),
     ):
         self.page = page
         self.size = size
         self.sort = sort
+        self.cursor = cursor
+        self.total = total
 
     def paginate(
             self,
@@ -39,37 +59,221 @@ class Paginator:
             item_factory: Callable[[Row], ModelT],
             *,
             sort_model: Base = None,
-            custom_sort: str = None,
+            custom_sort: str | Sequence[ColumnElement] = None,
+            unique_key: Sequence[str] = None,
     ) -> Page[ModelT]:
-        total = Session.execute(
-            select(func.count()).
-            select_from(query.subquery())
-        ).scalar_one()
+        """Return a page of results for `query`.
+
+        Pages may be selected by number, or by a cursor, which continues
+        from the last row of the previous page by filtering on the sort
+        key rather than skipping rows with an offset. The sort key is
+        made unique by appending the primary key of the query's primary
+        entity, or the `unique_key` columns if the query has no such
+        entity. A `custom_sort` given as SQL text cannot be used for
+        cursor paging, and its pages have no `next_cursor`.
+
+        The total is computed with a window count over the page query
+        where possible, otherwise with a separate count query. If the
+        total mode is `estimate`, the planner's row estimate for the
+        query is returned instead, and if `none`, the total is omitted.
+        """
+        page = self.paginate_rows(query, sort_model=sort_model, custom_sort=custom_sort, unique_key=unique_key)
+        return Page(
+            items=[item_factory(row) for row in page.items],
+            total=page.total,
+            page=page.page,
+            pages=page.pages,
+            next_cursor=page.next_cursor,
+        )
 
+    def paginate_rows(
+            self,
+            query: Select,
+            *,
+            sort_model: Base = None,
+            custom_sort: str | Sequence[ColumnElement] = None,
+            unique_key: Sequence[str] = None,
+    ) -> Page:
+        """Return a page of result rows for `query`, as for :meth:`paginate`,
+        but without converting the rows to output models. The returned
+        page is not validated."""
         try:
-            if sort_model:
-                sort_col = getattr(sort_model, self.sort)
+            keyset = _keyset(query, sort_model, self.sort, custom_sort, unique_key)
+            if keyset:
+                sort_cols = keyset
+            elif sort_model:
+                sort_cols = [getattr(sort_model, self.sort)]
             elif custom_sort:
-                sort_col = text(custom_sort)
+                sort_cols = [text(custom_sort)]
             else:
-                sort_col = self.sort
-
-            limit = self.size or total
-
-            items = [
-                item_factory(row) for row in Session.execute(
-                    query.
-                    order_by(sort_col).
-                    offset(limit * (self.page - 1)).
-                    limit(limit)
-                )
-            ]
-        except (AttributeError, CompileError):
+                sort_cols = [self.sort]
+
+            page_query = query
+            if self.cursor:
+                if not keyset:
+                    raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, 'Cursor paging is not supported')
+                page_query = page_query.where(_after(keyset, self._decode_cursor(len(keyset))))
+            elif self.size:
+                page_query = page_query.offset(self.size * (self.page - 1))
+
+            if keyset:
+                page_query = page_query.add_columns(*(col.label(f'_k{i}') for i, col in enumerate(keyset)))
+
+            # the window count is evaluated before the limit and offset are
+            # applied, giving the exact total in the same round trip; this
+            # does not apply to the remainder of a listing after a cursor
+            window_total = self.total == TotalMode.EXACT and not self.cursor
+            if window_total:
+                page_query = page_query.add_columns(func.count().over().label('_total'))
+
+            # fetch one extra row to find out whether there is a next page
+            rows = Session.execute(
+                page_query.
+                order_by(*sort_cols).
+                limit(self.size + 1 if self.size else None)
+            ).all()
+
+        except (AttributeError, KeyError, CompileError):
             raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, 'Invalid sort column')
 
-        return Page(
-            items=items,
+        if window_total and (rows or self.page == 1):
+            total = rows[0]._mapping['_total'] if rows else 0
+        elif self.total == TotalMode.EXACT:
+            total = _count(query)
+        elif self.total == TotalMode.ESTIMATE:
+            total = _estimate_count(query)
+        else:
+            total = None
+
+        next_cursor = None
+        if self.size and len(rows) > self.size:
+            rows = rows[:self.size]
+            if keyset:
+                last_row = rows[-1]._mapping
+                next_cursor = self._encode_cursor([last_row[f'_k{i}'] for i in range(len(keyset))])
+
+        if total is None:
+            pages = None
+        elif self.size:
+            pages = ceil(total / self.size)
+        else:
+            pages = 1 if total else 0
+
+        return Page.construct(
+            items=rows,
             total=total,
             page=self.page,
-            pages=ceil(total / limit) if limit else 0,
+            pages=pages,
+            next_cursor=next_cursor,
         )
+
+    def _encode_cursor(self, values: list[Any]) -> str:
+        try:
+            data = json.dumps(dict(sort=self.sort, key=values), default=_encode_value)
+        except TypeError:
+            raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, 'Cursor paging is not supported for this sort column')
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def _decode_cursor(self, key_length: int) -> list[Any]:
+        try:
+            data = json.loads(base64.urlsafe_b64decode(self.cursor), object_hook=_decode_value)
+            if data['sort'] != self.sort or len(data['key']) != key_length:
+                raise ValueError
+            return data['key']
+        except (binascii.Error, TypeError, KeyError, ValueError, InvalidOperation):
+            raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, 'Invalid cursor')
+
+
+def _keyset(
+        query: Select,
+        sort_model: Optional[Base],
+        sort: str,
+        custom_sort: str | Sequence[ColumnElement] | None,
+        unique_key: Optional[Sequence[str]],
+) -> Optional[list[ColumnElement]]:
+    """Return the sort columns followed by unique key columns for
+    keyset paging, or None if the sort order is given as SQL text."""
+    if sort_model:
+        sort_cols = [getattr(sort_model, sort).expression]
+    elif isinstance(custom_sort, str):
+        return None
+    elif custom_sort:
+        sort_cols = list(custom_sort)
+    else:
+        sort_cols = [query.selected_columns[sort]]
+
+    if unique_key:
+        key_cols = [query.selected_columns[name] for name in unique_key]
+    else:
+        try:
+            key_cols = list(inspect(query.column_descriptions[0]['entity']).primary_key)
+        except NoInspectionAvailable:
+            return None
+
+    return sort_cols + [
+        key_col for key_col in key_cols
+        if not any(key_col.compare(sort_col) for sort_col in sort_cols)
+    ]
+
+
+def _after(keyset: list[ColumnElement], values: list[Any]) -> ColumnElement:
+    """Return a condition selecting rows that follow `values` in
+    ascending keyset order, in which nulls sort last."""
+    if None not in values and not any(getattr(col, 'nullable', True) for col in keyset):
+        # row comparison, which can be satisfied by an index range scan
+        return tuple_(*keyset) > tuple_(*values)
+
+    conditions = []
+    for i, (col, value) in enumerate(zip(keyset, values)):
+        conditions += [and_(
+            *(prev_col == prev_value if prev_value is not None else prev_col.is_(None)
+              for prev_col, prev_value in zip(keyset[:i], values[:i])),
+            or_(col > value, col.is_(None)) if value is not None else false(),
+        )]
+    return or_(*conditions)
+
+
+def _count(query: Select) -> int:
+    return Session.execute(
+        select(func.count()).
+        select_from(query.subquery())
+    ).scalar_one()
+
+
+def _estimate_count(query: Select) -> int:
+    """Return the planner's estimate of the number of rows returned
+    by `query`."""
+    plan = Session.execute(_Explain(query)).scalar_one()
+    return plan[0]['Plan']['Plan Rows']
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    raise TypeError
+
+
+def _decode_value(obj: dict) -> Any:
+    if '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    if '$date' in obj:
+        return date.fromisoformat(obj['$date'])
+    if '$decimal' in obj:
+        return Decimal(obj['$decimal'])
+    return obj
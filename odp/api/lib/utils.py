@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Optional
 
 from odp.api.models import PublishedDataCiteRecordModel, PublishedRecordModel, PublishedSAEONRecordModel, TagInstanceModel
 from odp.db.models import CatalogRecord, CollectionTag, RecordTag
@@ -22,8 +22,14 @@ def output_published_record_model(catalog_record: CatalogRecord) -> Optional[Pub
     if not catalog_record.published:
         return None
 
-    if catalog_record.catalog_id == ODPCatalog.SAEON:
-        return PublishedSAEONRecordModel(**catalog_record.published_record)
+    return published_record_model(catalog_record.catalog_id, catalog_record.published_record)
 
-    if catalog_record.catalog_id == ODPCatalog.DATACITE:
-        return PublishedDataCiteRecordModel(**catalog_record.published_record)
+
+def published_record_model(catalog_id: str, published_record: dict[str, Any]) -> Optional[PublishedRecordModel]:
+    """Return the output model of a published record of the given
+    catalog, from its stored (catalog_record.published_record) form."""
+    if catalog_id == ODPCatalog.SAEON:
+        return PublishedSAEONRecordModel(**published_record)
+
+    if catalog_id == ODPCatalog.DATACITE:
+        return PublishedDataCiteRecordModel(**published_record)
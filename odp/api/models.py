@@ -61,12 +61,25 @@ class PublishedSAEONRecordModel(PublishedRecordModel):
     timestamp: str
 
 
+class PublishedSAEONSearchResultModel(PublishedSAEONRecordModel):
+    highlight: Optional[str]
+
+
 class PublishedDataCiteRecordModel(PublishedRecordModel):
     doi: str
     url: Optional[AnyHttpUrl]
     metadata: dict[str, Any]
 
 
+class PublishedRecordChangeModel(BaseModel):
+    record_id: str
+    doi: Optional[str]
+    published: bool
+    deleted: bool
+    changed: str
+    published_record: Optional[PublishedSAEONRecordModel | PublishedDataCiteRecordModel]
+
+
 class CatalogRecordModel(BaseModel):
     catalog_id: str
     record_id: str
@@ -1,26 +1,208 @@
+import hashlib
+import json
 import re
-from typing import Any, Optional
+import zlib
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Iterator, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
-from fastapi.responses import RedirectResponse
-from sqlalchemy import and_, func, select, text
-from starlette.status import HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy import ARRAY, String, Text, and_, cast, false, func, literal_column, null, or_, select, true, union_all
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Subquery
+from starlette.status import HTTP_304_NOT_MODIFIED, HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY
 
 from odp.api.lib.auth import Authorize
-from odp.api.lib.catalog import get_catalog_ui_url
+from odp.api.lib.cache import cache_headers, not_modified
+from odp.api.lib.catalog import facet_counts, get_catalog_ui_url
 from odp.api.lib.datacite import get_datacite_client
 from odp.api.lib.paging import Page, Paginator
-from odp.api.lib.utils import output_published_record_model
-from odp.api.models import CatalogModel, PublishedDataCiteRecordModel, PublishedSAEONRecordModel
-from odp.db import Session
-from odp.db.models import Catalog, CatalogRecord
+from odp.api.lib.utils import output_published_record_model, published_record_model
+from odp.api.models import (CatalogModel, PublishedDataCiteRecordModel, PublishedRecordChangeModel, PublishedRecordModel, PublishedSAEONRecordModel,
+                            PublishedSAEONSearchResultModel)
+from odp.db import Session, engine
+from odp.db.models import Catalog, CatalogFacetCount, CatalogRecord, CatalogRecordTombstone
 from odp.lib.datacite import DataciteClient
 from odp.lib.exceptions import DataciteError
-from odplib.const import DOI_REGEX, ODPCatalog, ODPScope
+from odplib.const import DOI_REGEX, ODPCatalog, ODPMetadataSchema, ODPScope
 
 router = APIRouter()
 
+# number of rows fetched at a time by the catalog export
+EXPORT_BATCH_SIZE = 1000
+
+# age below which changes are withheld from the change feed; this must
+# exceed the time taken by the publisher to write and commit a batch
+CHANGE_FEED_DELAY = timedelta(minutes=1)
+
+# facets by which published records may be filtered and counted; keyword
+# values are held in catalog_record.keywords, and all others in
+# catalog_record.facets as 'facet:value'
+FACETS = 'collection', 'keyword', 'publisher', 'year', 'type'
+
+
+def headline_source_text():
+    """Return an expression for the text from which search result
+    snippets are taken: the title and description of the published
+    DataCite metadata."""
+    datacite = f'$.metadata[*] ? (@.schema_id == "{ODPMetadataSchema.SAEON_DATACITE_4.value}").metadata'
+    return func.concat_ws(
+        '\n',
+        func.jsonb_path_query_first(
+            CatalogRecord.published_record, literal_column(f"'{datacite}.titles[0].title'")
+        ).op('#>>')(literal_column("'{}'")),
+        func.jsonb_path_query_first(
+            CatalogRecord.published_record, literal_column(f"'{datacite}.descriptions[0].description'")
+        ).op('#>>')(literal_column("'{}'")),
+    )
+
+
+class BBoxMatch(str, Enum):
+    INTERSECT = 'intersect'  # the record's spatial extent intersects the bounding box
+    CONTAIN = 'contain'  # the bounding box contains the record's spatial extent
+
+
+def bbox_condition(bbox: str, bbox_match: BBoxMatch):
+    """Return a condition that selects records by spatial extent, given
+    a bounding box as 'west,south,east,north' in decimal degrees. A box
+    that crosses the antimeridian (west > east) is split in two.
+
+    The condition is expressed on CatalogRecord.spatial_extent, so that
+    it may be evaluated using the GiST index on that expression.
+    """
+    try:
+        west, south, east, north = (float(value) for value in bbox.split(','))
+    except ValueError:
+        raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, 'Invalid bbox: expecting west,south,east,north')
+
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, 'Invalid bbox: coordinates out of range')
+
+    if west <= east:
+        boxes = [(west, south, east, north)]
+    else:
+        boxes = [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+    operator = '&&' if bbox_match == BBoxMatch.INTERSECT else '<@'
+    return or_(*(
+        CatalogRecord.spatial_extent.bool_op(operator)(
+            func.box(func.point(box_west, box_south), func.point(box_east, box_north))
+        )
+        for box_west, box_south, box_east, box_north in boxes
+    ))
+
+
+def search_conditions(
+        catalog_id: str,
+        text_q: Optional[str],
+        facet: Optional[list[str]],
+        bbox: Optional[str],
+        bbox_match: BBoxMatch,
+) -> list:
+    """Return the conditions that select the published records of a
+    catalog matching the given search terms, facet filters and bounding
+    box.
+
+    Values of the same facet are ORed, and different facets are ANDed.
+    """
+    conditions = [
+        CatalogRecord.catalog_id == catalog_id,
+        CatalogRecord.published,
+    ]
+
+    if text_q:
+        conditions += [CatalogRecord.full_text.bool_op('@@')(func.websearch_to_tsquery('english', text_q))]
+
+    facet_values = {}
+    for facet_filter in facet or ():
+        name, sep, value = facet_filter.partition(':')
+        if not sep or not value or name not in FACETS:
+            raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, f'Invalid facet filter: {facet_filter}')
+        facet_values.setdefault(name, []).append(value)
+
+    for name, values in facet_values.items():
+        if name == 'keyword':
+            conditions += [CatalogRecord.keywords.bool_op('&&')(cast(array(values), ARRAY(String)))]
+        else:
+            conditions += [CatalogRecord.facets.bool_op('&&')(
+                cast(array([f'{name}:{value}' for value in values]), ARRAY(String))
+            )]
+
+    if bbox:
+        conditions += [bbox_condition(bbox, bbox_match)]
+
+    return conditions
+
+
+def top_facet_values(counts: Subquery, size: int) -> list[Row]:
+    """Select the `size` most frequent values of each facet from a
+    (facet, value, count) subquery, ordered by facet and rank."""
+    ranked = select(
+        counts,
+        func.row_number().over(
+            partition_by=counts.c.facet,
+            order_by=(counts.c.count.desc(), counts.c.value),
+        ).label('rank'),
+    ).subquery()
+
+    return Session.execute(
+        select(ranked.c.facet, ranked.c.value, ranked.c.count).
+        where(ranked.c.rank <= size).
+        order_by(ranked.c.facet, ranked.c.rank)
+    ).all()
+
+
+def output_search_result_model(row, highlight: bool) -> PublishedRecordModel:
+    published_record = output_published_record_model(row.CatalogRecord)
+    if highlight and isinstance(published_record, PublishedSAEONRecordModel):
+        return PublishedSAEONSearchResultModel(**published_record.dict(), highlight=row.highlight)
+    return published_record
+
+
+def export_published_records(catalog_id: str, compress: bool) -> Iterator[bytes]:
+    """Generate the published records of a catalog as newline-delimited
+    JSON, optionally gzip-compressed.
+
+    Records are fetched through a server-side cursor, in batches, on a
+    connection of their own, since the response is streamed after the
+    request's session has been closed.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # gzip container
+    stmt = (
+        select(cast(CatalogRecord.published_record, Text)).
+        where(CatalogRecord.catalog_id == catalog_id).
+        where(CatalogRecord.published).
+        order_by(CatalogRecord.record_id)
+    )
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(stmt)
+        for rows in result.yield_per(EXPORT_BATCH_SIZE).partitions():
+            chunk = ''.join(f'{row.published_record}\n' for row in rows).encode()
+            yield compressor.compress(chunk) if compressor else chunk
+
+    if compressor:
+        yield compressor.flush()
+
+
+def accepts_gzip(request: Request) -> bool:
+    """Return True if the client accepts gzip content coding, i.e. lists
+    gzip in its Accept-Encoding header with a non-zero quality value."""
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, *params = coding.split(';')
+        if name.strip().lower() == 'gzip':
+            for param in params:
+                key, _, value = param.partition('=')
+                if key.strip() == 'q':
+                    try:
+                        return float(value) > 0
+                    except ValueError:
+                        return False
+            return True
+    return False
+
 
 @router.get(
     '/',
@@ -71,32 +253,235 @@ async def get_catalog(
 
 @router.get(
     '/{catalog_id}/records',
-    response_model=Page[PublishedSAEONRecordModel | PublishedDataCiteRecordModel],
+    response_model=Page[PublishedSAEONSearchResultModel | PublishedDataCiteRecordModel],
     dependencies=[Depends(Authorize(ODPScope.CATALOG_READ))],
 )
 async def list_published_records(
+        request: Request,
+        response: Response,
         catalog_id: str,
         paginator: Paginator = Depends(),
         text_q: str = Query(None, title='Search terms'),
+        facet: list[str] = Query(None, title='Facet filters, as facet:value'),
+        bbox: str = Query(None, title='Bounding box, as west,south,east,north'),
+        bbox_match: BBoxMatch = Query(BBoxMatch.INTERSECT, title='Spatial relation to the bounding box'),
+        highlight: bool = Query(False, title='Include snippets of matching text (with text_q)'),
 ):
+    """List published records. Search terms may be given in web search
+    syntax, and search results may be sorted by relevance (`sort=relevance`).
+    Records may be filtered by facet values, e.g. `facet=year:2021`; facet
+    counts are obtained from `/catalog/{catalog_id}/facets`. Records may
+    also be filtered by spatial extent, either intersecting or contained
+    in a bounding box (`bbox=west,south,east,north`).
+
+    The response carries a weak ETag derived from the content hashes of
+    the listed records. These are obtained by a keys-only page query, so
+    that an unchanged page is answered with 304 (Not Modified) without
+    loading the published records, computing snippets or building the
+    response."""
     if not Session.get(Catalog, catalog_id):
         raise HTTPException(HTTP_404_NOT_FOUND)
 
+    text_q = text_q.strip() if text_q else None
+    keys_stmt = (
+        select(CatalogRecord.record_id, CatalogRecord.published_md5).
+        where(*search_conditions(catalog_id, text_q, facet, bbox, bbox_match))
+    )
     stmt = (
         select(CatalogRecord).
         where(CatalogRecord.catalog_id == catalog_id).
         where(CatalogRecord.published)
     )
 
-    if text_q and (text_q := text_q.strip()):
-        stmt = stmt.where(text(
-            "full_text @@ plainto_tsquery('english', :text_q)"
-        ).bindparams(text_q=text_q))
+    custom_sort = None
+    if text_q:
+        ts_query = func.websearch_to_tsquery('english', text_q)
+
+        if paginator.sort == 'relevance':
+            # negated, so that the best matches sort first
+            custom_sort = [-func.ts_rank_cd(CatalogRecord.full_text, ts_query)]
+
+        if highlight:
+            stmt = stmt.add_columns(func.ts_headline(
+                'english', headline_source_text(), ts_query, 'MaxFragments=3, MaxWords=20, MinWords=8',
+            ).label('highlight'))
+    else:
+        highlight = False
+
+    if not custom_sort:
+        paginator.sort = 'record_id'
+
+    keys_page = paginator.paginate_rows(
+        keys_stmt,
+        custom_sort=custom_sort,
+    )
+
+    # snippets are determined by the published records and the search
+    # terms, which are part of the URL to which the ETag applies
+    etag_data = [row.published_md5 for row in keys_page.items] + [keys_page.total, keys_page.next_cursor]
+    etag = f'W/"{hashlib.md5(json.dumps(etag_data).encode()).hexdigest()}"'
+    headers = cache_headers(etag, None)
+    if not_modified(request, etag, None):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+    rows = {
+        row.CatalogRecord.record_id: row
+        for row in Session.execute(
+            stmt.where(CatalogRecord.record_id.in_([row.record_id for row in keys_page.items]))
+        )
+    } if keys_page.items else {}
+
+    response.headers.update(headers)
+    return Page(
+        # a record may have been retracted since the keys were selected
+        items=[output_search_result_model(rows[row.record_id], highlight) for row in keys_page.items if row.record_id in rows],
+        total=keys_page.total,
+        page=keys_page.page,
+        pages=keys_page.pages,
+        next_cursor=keys_page.next_cursor,
+    )
+
+
+@router.get(
+    '/{catalog_id}/facets',
+    response_model=dict[str, dict[str, int]],
+    dependencies=[Depends(Authorize(ODPScope.CATALOG_READ))],
+)
+async def list_published_record_facets(
+        response: Response,
+        catalog_id: str,
+        text_q: str = Query(None, title='Search terms'),
+        facet: list[str] = Query(None, title='Facet filters, as facet:value'),
+        bbox: str = Query(None, title='Bounding box, as west,south,east,north'),
+        bbox_match: BBoxMatch = Query(BBoxMatch.INTERSECT, title='Spatial relation to the bounding box'),
+        size: int = Query(20, ge=1, le=1000, title='Maximum number of values per facet'),
+):
+    """Count the published records matching the given search terms, facet
+    filters and bounding box, by facet value. The most frequent values of each facet
+    are returned, keyed by facet name.
+
+    Unfiltered counts are as of the latest publishing run."""
+    if not Session.get(Catalog, catalog_id):
+        raise HTTPException(HTTP_404_NOT_FOUND)
+
+    text_q = text_q.strip() if text_q else None
+    conditions = search_conditions(catalog_id, text_q, facet, bbox, bbox_match)
+
+    # unfiltered counts are pre-computed by the publisher
+    rows = []
+    if not (text_q or facet or bbox):
+        rows = top_facet_values(
+            select(CatalogFacetCount.facet, CatalogFacetCount.value, CatalogFacetCount.count).
+            where(CatalogFacetCount.catalog_id == catalog_id).
+            subquery(),
+            size,
+        )
+    if not rows:
+        rows = top_facet_values(facet_counts(*conditions), size)
+
+    result = {name: {} for name in FACETS}
+    for row in rows:
+        if row.facet in result:
+            result[row.facet][row.value] = row.count
 
-    paginator.sort = 'record_id'
+    response.headers.update(cache_headers(None, None))
+    return result
+
+
+@router.get(
+    '/{catalog_id}/export',
+    response_class=StreamingResponse,
+    dependencies=[Depends(Authorize(ODPScope.CATALOG_READ))],
+)
+async def export_catalog(
+        request: Request,
+        catalog_id: str,
+):
+    """Export all published records of a catalog as newline-delimited
+    JSON, in record id order. The export is gzip-compressed if the
+    client accepts gzip encoding."""
+    if not Session.get(Catalog, catalog_id):
+        raise HTTPException(HTTP_404_NOT_FOUND)
+
+    compress = accepts_gzip(request)
+    headers = {'Vary': 'Accept-Encoding'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+
+    return StreamingResponse(
+        export_published_records(catalog_id, compress),
+        media_type='application/x-ndjson',
+        headers=headers,
+    )
+
+
+@router.get(
+    '/{catalog_id}/changes',
+    response_model=Page[PublishedRecordChangeModel],
+    dependencies=[Depends(Authorize(ODPScope.CATALOG_READ))],
+)
+async def list_published_record_changes(
+        catalog_id: str,
+        paginator: Paginator = Depends(),
+        from_: datetime = Query(None, alias='from', title='Include changes from this time (inclusive)'),
+        until: datetime = Query(None, title='Include changes until this time (exclusive)'),
+):
+    """List changes to a catalog's published records, in order of change
+    time, for incremental harvesting. A record that has been retracted is
+    listed as not published, and a record that has been deleted is listed
+    with `deleted` set. To continue harvesting, follow `next_cursor`, or
+    pass the last change time as `from`.
+
+    Changes made within the last `CHANGE_FEED_DELAY` are not yet listed,
+    so that a change that is still being committed cannot be skipped."""
+    if not Session.get(Catalog, catalog_id):
+        raise HTTPException(HTTP_404_NOT_FOUND)
+
+    latest = datetime.now(timezone.utc) - CHANGE_FEED_DELAY
+    until = min(until, latest) if until else latest
+
+    changes_stmt = (
+        select(
+            CatalogRecord.record_id,
+            CatalogRecord.doi,
+            CatalogRecord.published,
+            false().label('deleted'),
+            CatalogRecord.changed,
+            CatalogRecord.published_record,
+        ).
+        where(CatalogRecord.catalog_id == catalog_id).
+        where(CatalogRecord.changed < until)
+    )
+    tombstones_stmt = (
+        select(
+            CatalogRecordTombstone.record_id,
+            CatalogRecordTombstone.doi,
+            false().label('published'),
+            true().label('deleted'),
+            CatalogRecordTombstone.changed,
+            null().label('published_record'),
+        ).
+        where(CatalogRecordTombstone.catalog_id == catalog_id).
+        where(CatalogRecordTombstone.changed < until)
+    )
+    if from_:
+        changes_stmt = changes_stmt.where(CatalogRecord.changed >= from_)
+        tombstones_stmt = tombstones_stmt.where(CatalogRecordTombstone.changed >= from_)
+
+    changes_subq = union_all(changes_stmt, tombstones_stmt).subquery()
+
+    paginator.sort = 'changed'
     return paginator.paginate(
-        stmt,
-        lambda row: output_published_record_model(row.CatalogRecord),
+        select(changes_subq),
+        lambda row: PublishedRecordChangeModel(
+            record_id=row.record_id,
+            doi=row.doi,
+            published=row.published,
+            deleted=row.deleted,
+            changed=row.changed.isoformat(),
+            published_record=published_record_model(catalog_id, row.published_record) if row.published else None,
+        ),
+        unique_key=('record_id',),
     )
 
 
@@ -106,11 +491,18 @@ async def list_published_records(
     dependencies=[Depends(Authorize(ODPScope.CATALOG_READ))],
 )
 async def get_published_record(
+        request: Request,
+        response: Response,
         catalog_id: str,
         record_id: str = Path(..., title='UUID or DOI'),
 ):
+    """Get a published record. The ETag is the hash of the published record
+    and Last-Modified is the time at which the published record was last
+    written - which reflects embargo transitions as well as changes to the
+    record - so that a conditional request for an unchanged record is
+    answered with 304 (Not Modified) after an index lookup."""
     stmt = (
-        select(CatalogRecord).
+        select(CatalogRecord.record_id, CatalogRecord.published_md5, CatalogRecord.changed).
         where(CatalogRecord.catalog_id == catalog_id).
         where(CatalogRecord.published)
     )
@@ -121,15 +513,20 @@ async def get_published_record(
 
     except ValueError:
         if re.match(DOI_REGEX, record_id):
-            stmt = stmt.where(CatalogRecord.published_record.comparator.contains({
-                'doi': record_id
-            }))
+            stmt = stmt.where(CatalogRecord.doi == record_id)
         else:
             raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, 'Invalid record identifier: expecting a UUID or DOI')
 
-    if not (catalog_record := Session.execute(stmt).scalar_one_or_none()):
+    if not (result := Session.execute(stmt).one_or_none()):
         raise HTTPException(HTTP_404_NOT_FOUND)
 
+    etag = f'"{result.published_md5}"' if result.published_md5 else None
+    headers = cache_headers(etag, result.changed)
+    if not_modified(request, etag, result.changed):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+    catalog_record = Session.get(CatalogRecord, (catalog_id, result.record_id))
+    response.headers.update(headers)
     return output_published_record_model(catalog_record)
 
 
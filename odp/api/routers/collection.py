@@ -396,6 +396,7 @@ async def get_collection_audit_log(
             command=row.command,
             timestamp=row.timestamp.isoformat(),
         ),
+        unique_key=('table', 'id'),
     )
 
 
@@ -1,9 +1,11 @@
-from datetime import datetime, timezone
+import logging
+from datetime import date, datetime, timezone
 from typing import Any
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from jschon import JSON, JSONSchema
+from jschon.jsonschema import Result
 from sqlalchemy import and_, literal_column, null, or_, select, union_all
 from sqlalchemy.orm import aliased
 from starlette.status import HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, HTTP_409_CONFLICT, HTTP_422_UNPROCESSABLE_ENTITY
@@ -17,10 +19,13 @@ from odp.api.models import (AuditModel, CatalogRecordModel, RecordAuditModel, Re
 from odp.db import Session
 from odp.db.models import (AuditCommand, CatalogRecord, Collection, CollectionTag, PublishedDOI, Record, RecordAudit, RecordTag, RecordTagAudit,
                            SchemaType, Tag, TagCardinality, TagType, User)
-from odplib.const import ODPCollectionTag, ODPMetadataSchema, ODPScope
+from odp.lib.schema import schema_md5, translate_to_datacite
+from odplib.const import ODPCollectionTag, ODPMetadataSchema, ODPRecordTag, ODPScope
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 
 def output_record_model(record: Record) -> RecordModel:
     return RecordModel(
@@ -58,13 +63,28 @@ def output_catalog_record_model(catalog_record: CatalogRecord) -> CatalogRecordM
     )
 
 
-def get_validity(metadata: dict[str, Any], schema: JSONSchema) -> Any:
-    if (result := schema.evaluate(JSON(metadata))).valid:
+def get_validity(result: Result) -> Any:
+    if result.valid:
         return result.output('flag')
 
     return result.output('detailed')
 
 
+def set_translation(record: Record, result: Result, schema: JSONSchema) -> None:
+    """Store the SAEON DataCite translation of an ISO19115 record, with
+    the MD5 of the schema that produced it, for reuse by the publisher."""
+    record.translation = None
+    record.translation_md5 = None
+
+    if record.schema_id == ODPMetadataSchema.SAEON_ISO19115:
+        try:
+            record.translation = translate_to_datacite(result)
+            record.translation_md5 = schema_md5(str(schema.uri))
+        except Exception:
+            # the publisher translates afresh, and reports any errors
+            logger.exception(f'Failed to translate record {record.id}')
+
+
 def create_audit_record(
         auth: Authorized,
         record: Record,
@@ -158,7 +178,7 @@ async def list_records(
     return paginator.paginate(
         stmt,
         lambda row: output_record_model(row.Record),
-        custom_sort='collection.id, record.doi, record.sid',
+        custom_sort=(Collection.id, Record.doi, Record.sid),
     )
 
 
@@ -238,9 +258,10 @@ def _create_record(
         schema_id=record_in.schema_id,
         schema_type=SchemaType.metadata,
         metadata_=record_in.metadata,
-        validity=get_validity(record_in.metadata, metadata_schema),
+        validity=get_validity(result := metadata_schema.evaluate(JSON(record_in.metadata))),
         timestamp=(timestamp := datetime.now(timezone.utc)),
     )
+    set_translation(record, result, metadata_schema)
     record.save()
 
     create_audit_record(auth, record, timestamp, AuditCommand.insert)
@@ -344,7 +365,8 @@ def _set_record(
         record.schema_id = record_in.schema_id
         record.schema_type = SchemaType.metadata
         record.metadata_ = record_in.metadata
-        record.validity = get_validity(record_in.metadata, metadata_schema)
+        record.validity = get_validity(result := metadata_schema.evaluate(JSON(record_in.metadata)))
+        set_translation(record, result, metadata_schema)
         record.timestamp = (timestamp := datetime.now(timezone.utc))
         record.save()
 
@@ -469,6 +491,15 @@ async def tag_record(
         if not validity['valid']:
             raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, validity)
 
+        # the date format is not asserted by the tag schema
+        if tag.id == ODPRecordTag.EMBARGO:
+            try:
+                for key in 'start', 'end':
+                    if tag_instance_in.data[key] is not None:
+                        date.fromisoformat(tag_instance_in.data[key])
+            except ValueError:
+                raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, f'Invalid embargo {key} date')
+
         record_tag.data = tag_instance_in.data
         record_tag.timestamp = (timestamp := datetime.now(timezone.utc))
         record_tag.save()
@@ -635,6 +666,7 @@ async def get_record_audit_log(
             command=row.command,
             timestamp=row.timestamp.isoformat(),
         ),
+        unique_key=('table', 'id'),
     )
 
 
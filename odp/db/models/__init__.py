@@ -1,10 +1,15 @@
 from .catalog import Catalog
+from .catalog_facet_count import CatalogFacetCount
 from .catalog_record import CatalogRecord
+from .catalog_record_queue import CatalogRecordQueue
+from .catalog_record_tombstone import CatalogRecordTombstone
 from .client import Client
 from .client_scope import ClientScope
 from .collection import Collection, CollectionAudit
 from .collection_tag import CollectionTag, CollectionTagAudit
+from .embargo_schedule import EmbargoSchedule
 from .provider import Provider
+from .publish_run import PublishRun, PublishRunBatch
 from .published_doi import PublishedDOI
 from .record import Record, RecordAudit
 from .record_tag import RecordTag, RecordTagAudit
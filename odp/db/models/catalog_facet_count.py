@@ -0,0 +1,23 @@
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+from odp.db import Base
+
+
+class CatalogFacetCount(Base):
+    """The number of published records of an indexed catalog per
+    facet value, for unfiltered facet counts.
+
+    Counts are recomputed by the publisher at the end of each publishing
+    run in which records were evaluated for the catalog. A catalog
+    without counts (e.g. one not yet published to since this table was
+    created) has its facets counted on the fly.
+    """
+
+    __tablename__ = 'catalog_facet_count'
+
+    catalog_id = Column(String, ForeignKey('catalog.id', ondelete='CASCADE'), primary_key=True)
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+    _repr_ = 'catalog_id', 'facet', 'value', 'count'
@@ -1,6 +1,6 @@
-from sqlalchemy import ARRAY, Boolean, Column, DateTime, ForeignKey, Integer, Numeric, String, TIMESTAMP
+from sqlalchemy import ARRAY, Boolean, Column, DateTime, ForeignKey, Index, Integer, Numeric, String, TIMESTAMP, func, text
 from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 
 from odp.db import Base
 
@@ -12,6 +12,18 @@ class CatalogRecord(Base):
 
     __tablename__ = 'catalog_record'
 
+    __table_args__ = (
+        Index(
+            'ix_catalog_record_sync_due', 'catalog_id', 'next_attempt_at',
+            postgresql_where=text('NOT synced'),
+        ),
+        Index('ix_catalog_record_full_text', 'full_text', postgresql_using='gin'),
+        Index('ix_catalog_record_catalog_id_doi', 'catalog_id', 'doi'),
+        Index('ix_catalog_record_catalog_id_changed', 'catalog_id', 'changed'),
+        Index('ix_catalog_record_keywords', 'keywords', postgresql_using='gin'),
+        Index('ix_catalog_record_facets', 'facets', postgresql_using='gin'),
+    )
+
     catalog_id = Column(String, ForeignKey('catalog.id', ondelete='CASCADE'), primary_key=True)
     record_id = Column(String, ForeignKey('record.id', ondelete='CASCADE'), primary_key=True)
 
@@ -20,20 +32,36 @@ class CatalogRecord(Base):
 
     published = Column(Boolean, nullable=False)
     published_record = Column(JSONB)
+    published_md5 = Column(String)  # hash of published_record, for detecting unchanged output
+    doi = Column(String)  # DOI of published_record, for lookup
     reason = Column(String)
     timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
+    changed = Column(TIMESTAMP(timezone=True))  # time at which the published form was last written, for the change feed
 
     # external catalog integration
     synced = Column(Boolean)
     error = Column(String)
     error_count = Column(Integer)
+    next_attempt_at = Column(TIMESTAMP(timezone=True))  # null = due immediately
+    external_md5 = Column(String)  # hash of the record as returned by the external catalog on the last successful sync
 
     # internal catalog indexing
     full_text = Column(TSVECTOR)
     keywords = Column(ARRAY(String))
+    facets = Column(ARRAY(String))  # facet values, as 'facet:value'
     spatial_north = Column(Numeric)
     spatial_east = Column(Numeric)
     spatial_south = Column(Numeric)
     spatial_west = Column(Numeric)
+    spatial_extent = column_property(  # N-E-S-W extent as a box, for spatial search (GiST-indexed)
+        func.box(func.point(spatial_west, spatial_south), func.point(spatial_east, spatial_north)),
+        deferred=True,
+    )
     temporal_start = Column(DateTime)
     temporal_end = Column(DateTime)
+
+
+Index(
+    'ix_catalog_record_spatial_extent', CatalogRecord.spatial_extent.expression,
+    postgresql_using='gist',
+)
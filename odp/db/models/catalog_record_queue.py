@@ -0,0 +1,106 @@
+from sqlalchemy import Column, DDL, ForeignKey, String, TIMESTAMP, event
+
+from odp.db import Base
+from odp.db.models.catalog_record import CatalogRecord
+
+
+class CatalogRecordQueue(Base):
+    """Queue of records that have changed since they were last
+    evaluated for publication to a catalog.
+
+    Entries are maintained by triggers on the record, collection and
+    catalog tables, and are drained by the publisher once the change
+    has been reflected in the corresponding catalog_record entry. The
+    timestamp is that of the latest queued change, so that a change
+    made while the publisher is running is not lost.
+
+    A notification is sent on NOTIFY_CHANNEL whenever records are queued,
+    waking up the publisher daemon. The trigger fires per row, so that
+    statements that queue nothing do not notify. Notifications are
+    delivered on commit, and duplicates within a transaction are
+    collapsed by PostgreSQL.
+
+    When the table is created, it is seeded with every record whose
+    catalog_record entries are missing or older than the latest change
+    to the record or its collection, so that changes made before the
+    queue existed are not lost.
+    """
+
+    __tablename__ = 'catalog_record_queue'
+
+    catalog_id = Column(String, ForeignKey('catalog.id', ondelete='CASCADE'), primary_key=True)
+    record_id = Column(String, ForeignKey('record.id', ondelete='CASCADE'), primary_key=True)
+    timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    _repr_ = 'catalog_id', 'record_id', 'timestamp'
+
+
+# channel on which a notification is sent when records are queued
+NOTIFY_CHANNEL = 'catalog_record_queue'
+
+# the table is seeded from catalog_record, which must therefore be created first
+CatalogRecordQueue.__table__.add_is_dependent_on(CatalogRecord.__table__)
+
+event.listen(CatalogRecordQueue.__table__, 'after_create', DDL(f'''
+CREATE OR REPLACE FUNCTION catalog_record_queue_record() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO catalog_record_queue (catalog_id, record_id, timestamp)
+    SELECT catalog.id, NEW.id, NEW.timestamp FROM catalog
+    ON CONFLICT (catalog_id, record_id) DO UPDATE
+    SET timestamp = greatest(catalog_record_queue.timestamp, excluded.timestamp);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION catalog_record_queue_collection() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO catalog_record_queue (catalog_id, record_id, timestamp)
+    SELECT catalog.id, record.id, NEW.timestamp FROM catalog, record
+    WHERE record.collection_id = NEW.id
+    ON CONFLICT (catalog_id, record_id) DO UPDATE
+    SET timestamp = greatest(catalog_record_queue.timestamp, excluded.timestamp);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION catalog_record_queue_catalog() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO catalog_record_queue (catalog_id, record_id, timestamp)
+    SELECT NEW.id, record.id, record.timestamp FROM record
+    ON CONFLICT (catalog_id, record_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION catalog_record_queue_notify() RETURNS trigger AS $$
+BEGIN
+    NOTIFY {NOTIFY_CHANNEL};
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO catalog_record_queue (catalog_id, record_id, timestamp)
+SELECT catalog.id, record.id, greatest(collection.timestamp, record.timestamp)
+FROM catalog
+CROSS JOIN record
+JOIN collection ON collection.id = record.collection_id
+LEFT JOIN catalog_record ON catalog_record.catalog_id = catalog.id AND catalog_record.record_id = record.id
+WHERE catalog_record.record_id IS NULL
+OR catalog_record.timestamp < greatest(collection.timestamp, record.timestamp);
+
+CREATE TRIGGER catalog_record_queue_record
+AFTER INSERT OR UPDATE OF timestamp ON record
+FOR EACH ROW EXECUTE FUNCTION catalog_record_queue_record();
+
+CREATE TRIGGER catalog_record_queue_collection
+AFTER UPDATE OF timestamp ON collection
+FOR EACH ROW EXECUTE FUNCTION catalog_record_queue_collection();
+
+CREATE TRIGGER catalog_record_queue_catalog
+AFTER INSERT ON catalog
+FOR EACH ROW EXECUTE FUNCTION catalog_record_queue_catalog();
+
+CREATE TRIGGER catalog_record_queue_notify
+AFTER INSERT OR UPDATE ON catalog_record_queue
+FOR EACH ROW EXECUTE FUNCTION catalog_record_queue_notify();
+'''))
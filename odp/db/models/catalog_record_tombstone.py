@@ -0,0 +1,48 @@
+from sqlalchemy import Column, DDL, Index, String, TIMESTAMP, event
+
+from odp.db import Base
+from odp.db.models.catalog_record import CatalogRecord
+
+
+class CatalogRecordTombstone(Base):
+    """Record of a deleted catalog_record entry, so that harvesters of
+    the catalog's change feed can learn of deleted records.
+
+    Entries are created by a trigger on the catalog_record table, which
+    fires also when a catalog_record entry is deleted by a cascade from
+    the record table. There are no foreign keys, since a tombstone
+    outlives the record to which it refers.
+    """
+
+    __tablename__ = 'catalog_record_tombstone'
+
+    __table_args__ = (
+        Index('ix_catalog_record_tombstone_catalog_id_changed', 'catalog_id', 'changed'),
+    )
+
+    catalog_id = Column(String, primary_key=True)
+    record_id = Column(String, primary_key=True)
+    doi = Column(String)
+    changed = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    _repr_ = 'catalog_id', 'record_id', 'doi', 'changed'
+
+
+# the trigger is defined on catalog_record, which must therefore be created first
+CatalogRecordTombstone.__table__.add_is_dependent_on(CatalogRecord.__table__)
+
+event.listen(CatalogRecordTombstone.__table__, 'after_create', DDL('''
+CREATE OR REPLACE FUNCTION catalog_record_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO catalog_record_tombstone (catalog_id, record_id, doi, changed)
+    VALUES (OLD.catalog_id, OLD.record_id, OLD.doi, statement_timestamp())
+    ON CONFLICT (catalog_id, record_id) DO UPDATE
+    SET doi = excluded.doi, changed = excluded.changed;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalog_record_tombstone
+AFTER DELETE ON catalog_record
+FOR EACH ROW EXECUTE FUNCTION catalog_record_tombstone();
+'''))
@@ -0,0 +1,98 @@
+from sqlalchemy import Column, DDL, Date, ForeignKey, Index, String, event
+
+from odp.db import Base
+from odplib.const import ODPRecordTag
+
+
+class EmbargoSchedule(Base):
+    """Upcoming embargo transitions - the start date and the day after
+    the end date of each embargo tag - per catalog.
+
+    Entries are maintained by triggers on the record_tag and catalog
+    tables. On or after its transition date, an entry is moved by the
+    publisher into the catalog_record_queue, so that only records whose
+    embargo state has flipped need to be re-evaluated.
+
+    When the table is created, it is seeded from existing embargo tags.
+    """
+
+    __tablename__ = 'embargo_schedule'
+
+    __table_args__ = (
+        Index('ix_embargo_schedule_catalog_id_date', 'catalog_id', 'date'),
+    )
+
+    catalog_id = Column(String, ForeignKey('catalog.id', ondelete='CASCADE'), primary_key=True)
+    record_tag_id = Column(String, ForeignKey('record_tag.id', ondelete='CASCADE'), primary_key=True)
+    date = Column(Date, primary_key=True)
+    record_id = Column(String, ForeignKey('record.id', ondelete='CASCADE'), nullable=False)
+
+    _repr_ = 'catalog_id', 'record_tag_id', 'date', 'record_id'
+
+
+event.listen(EmbargoSchedule.__table__, 'after_create', DDL(f'''
+-- embargo dates are not validated by the tag schema, so a malformed
+-- date is treated as absent rather than failing the tag write
+CREATE OR REPLACE FUNCTION embargo_schedule_date(value text) RETURNS date AS $$
+BEGIN
+    IF value !~ '^\\d{{4}}-\\d{{2}}-\\d{{2}}$' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::date;
+EXCEPTION WHEN datetime_field_overflow OR invalid_datetime_format THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE OR REPLACE FUNCTION embargo_schedule_record_tag() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM embargo_schedule WHERE record_tag_id = NEW.id;
+    IF NEW.tag_id = '{ODPRecordTag.EMBARGO.value}' THEN
+        INSERT INTO embargo_schedule (catalog_id, record_tag_id, date, record_id)
+        SELECT catalog.id, NEW.id, transition.date, NEW.record_id
+        FROM catalog, (VALUES
+            (embargo_schedule_date(NEW.data->>'start')),
+            (embargo_schedule_date(NEW.data->>'end') + 1)
+        ) AS transition (date)
+        WHERE transition.date > current_date
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION embargo_schedule_catalog() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO embargo_schedule (catalog_id, record_tag_id, date, record_id)
+    SELECT NEW.id, record_tag.id, transition.date, record_tag.record_id
+    FROM record_tag, LATERAL (VALUES
+        (embargo_schedule_date(record_tag.data->>'start')),
+        (embargo_schedule_date(record_tag.data->>'end') + 1)
+    ) AS transition (date)
+    WHERE record_tag.tag_id = '{ODPRecordTag.EMBARGO.value}'
+    AND transition.date > current_date
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- transitions falling on the current date are included, since the
+-- publisher may not yet have run today
+INSERT INTO embargo_schedule (catalog_id, record_tag_id, date, record_id)
+SELECT catalog.id, record_tag.id, transition.date, record_tag.record_id
+FROM catalog, record_tag, LATERAL (VALUES
+    (embargo_schedule_date(record_tag.data->>'start')),
+    (embargo_schedule_date(record_tag.data->>'end') + 1)
+) AS transition (date)
+WHERE record_tag.tag_id = '{ODPRecordTag.EMBARGO.value}'
+AND transition.date >= current_date
+ON CONFLICT DO NOTHING;
+
+CREATE TRIGGER embargo_schedule_record_tag
+AFTER INSERT OR UPDATE OF data ON record_tag
+FOR EACH ROW EXECUTE FUNCTION embargo_schedule_record_tag();
+
+CREATE TRIGGER embargo_schedule_catalog
+AFTER INSERT ON catalog
+FOR EACH ROW EXECUTE FUNCTION embargo_schedule_catalog();
+'''))
@@ -0,0 +1,57 @@
+import uuid
+
+from sqlalchemy import ARRAY, Boolean, Column, ForeignKey, Integer, String, TIMESTAMP
+from sqlalchemy.orm import relationship
+
+from odp.db import Base
+
+
+class PublishRun(Base):
+    """Journal of a publishing run.
+
+    Candidates are processed in batches in record id order. The
+    high_water_mark is the id of the last record in the longest
+    completed prefix of batches; each completed batch is recorded
+    in publish_run_batch. A run that is interrupted has a null
+    `finished` timestamp, and may be resumed by the next run.
+    """
+
+    __tablename__ = 'publish_run'
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    catalog_ids = Column(ARRAY(String), nullable=False)
+    full_scan = Column(Boolean, nullable=False)
+    shard_index = Column(Integer, nullable=False)
+    shard_count = Column(Integer, nullable=False)
+    started = Column(TIMESTAMP(timezone=True), nullable=False)
+    updated = Column(TIMESTAMP(timezone=True), nullable=False)
+    finished = Column(TIMESTAMP(timezone=True))
+    candidate_count = Column(Integer, nullable=False)
+    completed_count = Column(Integer, nullable=False)
+    high_water_mark = Column(String)
+
+    # view of completed batches (one-to-many)
+    batches = relationship('PublishRunBatch', viewonly=True)
+
+    _repr_ = ('id', 'catalog_ids', 'full_scan', 'shard_index', 'shard_count', 'started', 'finished',
+              'candidate_count', 'completed_count', 'high_water_mark')
+
+
+class PublishRunBatch(Base):
+    """A completed batch of a publishing run, spanning an inclusive
+    range of record ids.
+
+    A batch entry is written in the same transaction as the batch's
+    catalog_record updates, so it is present if and only if the batch
+    has been committed.
+    """
+
+    __tablename__ = 'publish_run_batch'
+
+    run_id = Column(String, ForeignKey('publish_run.id', ondelete='CASCADE'), primary_key=True)
+    first_record_id = Column(String, primary_key=True)
+    last_record_id = Column(String, nullable=False)
+    record_count = Column(Integer, nullable=False)
+    completed = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    _repr_ = 'run_id', 'first_record_id', 'last_record_id', 'record_count', 'completed'
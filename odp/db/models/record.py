@@ -39,6 +39,11 @@ class Record(Base):
     validity = Column(JSONB, nullable=False)
     timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
 
+    # SAEON DataCite translation of ISO19115 metadata, computed on validation;
+    # it is current only while translation_md5 matches the schema's MD5
+    translation = Column(JSONB)
+    translation_md5 = Column(String)
+
     collection_id = Column(String, ForeignKey('collection.id', onupdate='CASCADE', ondelete='RESTRICT'), nullable=False)
     collection = relationship('Collection')
 
@@ -1,15 +1,29 @@
+import hashlib
+import json
 import logging
-from datetime import date, datetime
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
 from enum import Enum
-from typing import final
+from typing import Any, NamedTuple, Optional, Type, final
 
-from sqlalchemy import func, or_, select
+from jschon import JSON, URI
+from sqlalchemy import ARRAY, BigInteger, String, bindparam, case, delete, func, literal, null, or_, select, true, update
+from sqlalchemy.dialects.postgresql import array, insert
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.sql.elements import ColumnElement
 
+from odp.api.lib.catalog import facet_counts
 from odp.api.lib.utils import output_published_record_model
 from odp.api.models import PublishedRecordModel, RecordModel
 from odp.api.routers.record import output_record_model
-from odp.db import Session
-from odp.db.models import CatalogRecord, Collection, PublishedDOI, Record, RecordTag
+from odp.db import Session, engine
+from odp.db.models import (CatalogFacetCount, CatalogRecord, CatalogRecordQueue, Collection, CollectionTag, EmbargoSchedule, PublishedDOI, PublishRun, PublishRunBatch,
+                           Record, RecordTag, Schema, SchemaType)
+from odp.job.publish.report import StageTimer, peak_memory_bytes
+from odp.lib.schema import schema_catalog, schema_md5, translate_to_datacite
+from odplib.config import config
 from odplib.const import ODPCollectionTag, ODPMetadataSchema, ODPRecordTag
 
 logger = logging.getLogger(__name__)
@@ -30,33 +44,123 @@ class NotPublishedReason(str, Enum):
     NO_DOI = 'no DOI'
 
 
+class RecordEvaluation(NamedTuple):
+    """The outcome of evaluating universal publication rules for a record."""
+    can_publish: bool
+    reasons: list[str]
+    published_md5: Optional[str]  # of the existing catalog_record entry
+
+
 class Publisher:
     def __init__(self, catalog_id: str) -> None:
         self.catalog_id = catalog_id
         self.indexed = False
         self.external = False
-        self.max_attempts = 3
+        self.doi_required = False
+        self.retry_delay = config.ODP.PUBLISH.SYNC_RETRY_DELAY
+        self.retry_max_delay = config.ODP.PUBLISH.SYNC_RETRY_MAX_DELAY
+        self.batch_size = config.ODP.PUBLISH.BATCH_SIZE
+        self.shard_index = config.ODP.PUBLISH.SHARD_INDEX
+        self.shard_count = config.ODP.PUBLISH.SHARD_COUNT
+        self.sync_workers = config.ODP.PUBLISH.SYNC_WORKERS
+        self.translations = {}  # by record id, for records unaltered by embargo processing
+        self.new_translations = {}  # by record id, to be saved
+        self.timer = StageTimer()
+        self.counts = {}
 
     @final
-    def run(self) -> None:
-        records = self._select_records()
-        logger.info(f'{self.catalog_id} catalog: {(total := len(records))} records selected for evaluation')
+    def run(self, full_scan: bool = False) -> None:
+        """Publish to this catalog alone. See :class:`MultiPublisher`."""
+        MultiPublisher([self]).run(full_scan)
 
-        published = 0
-        for record_id, timestamp in records:
-            published += self._sync_catalog_record(record_id, timestamp)
+    @final
+    def _select_candidates(self, full_scan: bool) -> list[tuple[str, datetime]]:
+        """Select records to be evaluated for publication to, or retraction
+        from, this catalog, after queueing any due embargo transitions.
 
-        if total:
-            logger.info(f'{self.catalog_id} catalog: {published} records published; {total - published} records hidden')
+        :return: a list of (record_id, timestamp) tuples
+        """
+        with self.timer.stage('select'):
+            self._queue_embargo_transitions()
+            records = self._scan_records() if full_scan else self._select_records()
 
-        if self.external:
-            self._sync_external()
+        logger.info(f'{self.catalog_id} catalog: {len(records)} records selected for evaluation')
+        return records
+
+    @final
+    def _in_shard(self, record_id_column) -> ColumnElement:
+        """Return a criterion that restricts `record_id_column` to the
+        hash partition of record ids handled by this publisher instance."""
+        if self.shard_count == 1:
+            return true()
+
+        return func.abs(func.hashtext(record_id_column).cast(BigInteger)) % self.shard_count == self.shard_index
 
     @final
     def _select_records(self) -> list[tuple[str, datetime]]:
         """Select records to be evaluated for publication to, or
         retraction from, a catalog.
 
+        A record is selected if it has an entry in the catalog_record_queue
+        for this catalog. This includes records whose embargo state changes
+        on the current date; see :meth:`_queue_embargo_transitions`.
+
+        :return: a list of (record_id, timestamp) tuples, where
+            timestamp is that of the latest contributing change
+        """
+        stmt = (
+            select(
+                Record.id,
+                func.greatest(
+                    Collection.timestamp,
+                    Record.timestamp,
+                )
+            ).
+            join(Collection).
+            join(CatalogRecordQueue).
+            where(CatalogRecordQueue.catalog_id == self.catalog_id).
+            where(self._in_shard(Record.id))
+        )
+
+        return Session.execute(stmt).all()
+
+    @final
+    def _queue_embargo_transitions(self) -> None:
+        """Move embargo_schedule entries that have come due for this catalog
+        into the catalog_record_queue, so that records are re-evaluated only
+        on the days that an embargo starts or ends.
+
+        The database's current date is used here, in embargo processing, and
+        in the embargo_schedule triggers, so that a transition cannot be
+        dropped due to a difference in time zone between the publisher
+        and the database.
+        """
+        due_cte = (
+            delete(EmbargoSchedule).
+            where(EmbargoSchedule.catalog_id == self.catalog_id).
+            where(EmbargoSchedule.date <= func.current_date()).
+            returning(EmbargoSchedule.record_id).
+            cte('due')
+        )
+
+        Session.execute(
+            insert(CatalogRecordQueue).
+            from_select(
+                ['catalog_id', 'record_id', 'timestamp'],
+                select(literal(self.catalog_id), Record.id, Record.timestamp).
+                where(Record.id.in_(select(due_cte.c.record_id)))
+            ).
+            on_conflict_do_nothing(index_elements=['catalog_id', 'record_id'])
+        )
+        Session.commit()
+
+    @final
+    def _scan_records(self) -> list[tuple[str, datetime]]:
+        """Select records to be evaluated for publication to, or
+        retraction from, a catalog, by comparing every record with
+        its catalog_record entry. This is a safety net for changes
+        that bypass the catalog_record_queue.
+
         A record is selected if:
 
         * there is no corresponding catalog_record entry; or
@@ -78,6 +182,7 @@ class Publisher:
                 ).label('max_timestamp')
             ).
             join(Collection).
+            where(self._in_shard(Record.id)).
             subquery()
         )
 
@@ -109,42 +214,278 @@ class Publisher:
         return Session.execute(stmt).all()
 
     @final
-    def _sync_catalog_record(self, record_id: str, timestamp: datetime) -> bool:
-        """Synchronize a catalog_record entry with the current state of the
-        corresponding record.
+    def _evaluate_records(self, record_ids: list[str]) -> dict[str, RecordEvaluation]:
+        """Evaluate the universal publication rules - as implemented by
+        :meth:`evaluate_record` - for a set of records, in a single query.
+
+        Records that pass may still be rejected by catalog-specific rules
+        applied by :meth:`evaluate_record`, which remains authoritative
+        for those records.
+
+        :return: a dict of RecordEvaluation tuples, keyed by record id,
+            for all of the given records that exist
+        """
+        def record_tag_exists(tag_id, *criteria):
+            return (
+                select(RecordTag.id).
+                where(RecordTag.record_id == Record.id).
+                where(RecordTag.tag_id == tag_id).
+                where(*criteria).
+                exists()
+            )
+
+        flags = (
+            select(
+                Record.id.label('record_id'),
+                (Record.doi != None).label('has_doi'),
+                func.coalesce(Record.validity['valid'].as_boolean(), False).label('metadata_valid'),
+                (
+                    select(CollectionTag.id).
+                    where(CollectionTag.collection_id == Record.collection_id).
+                    where(CollectionTag.tag_id == ODPCollectionTag.READY).
+                    exists()
+                ).label('collection_ready'),
+                (
+                    select(RecordTag.data['published'].as_boolean()).
+                    where(RecordTag.record_id == Record.id).
+                    where(RecordTag.tag_id == ODPRecordTag.MIGRATED).
+                    where(RecordTag.timestamp >= Record.timestamp).
+                    limit(1).
+                    scalar_subquery()
+                ).label('migrated_published'),
+                (
+                    record_tag_exists(ODPRecordTag.QC, RecordTag.data['pass_'].as_boolean() == True) &
+                    ~record_tag_exists(ODPRecordTag.QC, RecordTag.data['pass_'].as_boolean() == False)
+                ).label('qc_passed'),
+                record_tag_exists(ODPRecordTag.RETRACTED).label('retracted'),
+                (
+                    select(CatalogRecord.published_md5).
+                    where(CatalogRecord.catalog_id == self.catalog_id).
+                    where(CatalogRecord.record_id == Record.id).
+                    scalar_subquery()
+                ).label('published_md5'),
+            ).
+            where(Record.id.in_(record_ids)).
+            subquery()
+        )
+
+        not_migrated = flags.c.migrated_published == None
+
+        def reasons(*rules):
+            return func.array_remove(
+                array([case((condition, literal(reason.value)), else_=null()) for condition, reason in rules]),
+                null(),
+                type_=ARRAY(String),
+            )
+
+        not_published_reasons = reasons(
+            (~flags.c.collection_ready, NotPublishedReason.COLLECTION_NOT_READY),
+            (flags.c.migrated_published == False, NotPublishedReason.MIGRATED_NOT_PUBLISHED),
+            (not_migrated & ~flags.c.qc_passed, NotPublishedReason.QC_FAILED),
+            (not_migrated & flags.c.retracted, NotPublishedReason.RECORD_RETRACTED),
+            (not_migrated & ~flags.c.metadata_valid, NotPublishedReason.METADATA_INVALID),
+            (literal(self.doi_required) & ~flags.c.has_doi, NotPublishedReason.NO_DOI),
+        )
+        published_reasons = reasons(
+            (flags.c.collection_ready, PublishedReason.COLLECTION_READY),
+            (flags.c.migrated_published == True, PublishedReason.MIGRATED_PUBLISHED),
+            (not_migrated & flags.c.qc_passed, PublishedReason.QC_PASSED),
+        )
+
+        evaluations = (
+            select(
+                flags.c.record_id,
+                not_published_reasons.label('not_published_reasons'),
+                published_reasons.label('published_reasons'),
+                flags.c.published_md5,
+            ).
+            subquery()
+        )
+        can_publish = func.cardinality(evaluations.c.not_published_reasons) == 0
+
+        return {
+            row.record_id: RecordEvaluation(row.can_publish, row.reasons, row.published_md5)
+            for row in Session.execute(
+                select(
+                    evaluations.c.record_id,
+                    can_publish.label('can_publish'),
+                    case(
+                        (can_publish, evaluations.c.published_reasons),
+                        else_=evaluations.c.not_published_reasons,
+                    ).label('reasons'),
+                    evaluations.c.published_md5,
+                )
+            )
+        }
+
+    @final
+    def _sync_catalog_record(
+            self,
+            record: Record,
+            record_model: RecordModel,
+            timestamp: datetime,
+            existing_md5: Optional[str],
+            current_date: date,
+    ) -> tuple[CatalogRecord, bool]:
+        """Compute the state of the catalog_record entry corresponding
+        to the current state of a record.
 
         The catalog_record entry is stamped with the `timestamp` of the latest
         contributing change (from record / collection).
-        """
-        catalog_record = (Session.get(CatalogRecord, (self.catalog_id, record_id)) or
-                          CatalogRecord(catalog_id=self.catalog_id, record_id=record_id))
 
-        record = Session.get(Record, record_id)
-        record_model = output_record_model(record)
+        :param record_model: the output model of `record`, which may be
+            modified by embargo processing
+        :param existing_md5: published_md5 of the existing catalog_record entry
+        :param current_date: the database's current date, for embargo processing
+        :return: tuple(catalog_record, changed), as for :meth:`_apply_catalog_record_changes`
+        """
+        catalog_record = CatalogRecord(catalog_id=self.catalog_id, record_id=record.id)
 
-        can_publish, reasons = self.evaluate_record(record_model)
+        with self.timer.stage('evaluate'):
+            can_publish, reasons = self.evaluate_record(record_model)
         if can_publish:
-            self._process_embargoes(record_model)
-            self._save_published_doi(record_model)
+            with self.timer.stage('embargo'):
+                embargoed = self._process_embargoes(record_model, current_date)
+            if not embargoed:
+                # the record's metadata is unaltered, so its translation may be
+                # shared with other publishers; see translate_to_datacite
+                current = record.translation_md5 and record.translation_md5 == schema_md5(record.schema.uri)
+                self.translations.setdefault(record.id, record.translation if current else None)
             catalog_record.published = True
-            catalog_record.published_record = self.create_published_record(record_model).dict()
-            self._add_search_data(catalog_record)
+            with self.timer.stage('publish'):
+                catalog_record.published_record = self.create_published_record(record_model).dict()
         else:
             catalog_record.published = False
             catalog_record.published_record = None
-            self._clear_search_data(catalog_record)
+
+        catalog_record.reason = ' | '.join(reasons)
+        catalog_record.timestamp = timestamp
+
+        return catalog_record, self._apply_catalog_record_changes(catalog_record, existing_md5)
+
+    @final
+    def _apply_catalog_record_changes(self, catalog_record: CatalogRecord, existing_md5: Optional[str]) -> bool:
+        """Hash the published form of a computed catalog_record entry and
+        extract its DOI. If it differs from that of the existing entry,
+        update its search data and (for an external catalog) flag it for
+        re-sync.
+
+        If the published form is unchanged, then search data are not
+        recomputed and the record is not re-synced.
+
+        :param existing_md5: published_md5 of the existing catalog_record entry
+        :return: True if the catalog_record entry is to be written by
+            :meth:`_save_catalog_records`; False if it is unchanged, and
+            is to be written by :meth:`_touch_catalog_records`
+        """
+        catalog_record.published_md5 = _published_md5(catalog_record.published_record)
+        catalog_record.doi = catalog_record.published_record.get('doi') if catalog_record.published else None
+        if existing_md5 == catalog_record.published_md5:
+            return False
+
+        with self.timer.stage('search'):
+            if catalog_record.published:
+                self._add_search_data(catalog_record)
+            else:
+                self._clear_search_data(catalog_record)
 
         if self.external:
             catalog_record.synced = False
             catalog_record.error = None
             catalog_record.error_count = 0
+            catalog_record.next_attempt_at = None
 
-        catalog_record.reason = ' | '.join(reasons)
+        return True
+
+    @final
+    def _unpublished_catalog_record(
+            self,
+            record_id: str,
+            evaluation: RecordEvaluation,
+            timestamp: datetime,
+    ) -> tuple[CatalogRecord, bool]:
+        """Compute the state of the catalog_record entry for a record that
+        has failed the set-based evaluation of :meth:`_evaluate_records`.
+
+        :return: tuple(catalog_record, changed), as for :meth:`_apply_catalog_record_changes`
+        """
+        catalog_record = CatalogRecord(catalog_id=self.catalog_id, record_id=record_id)
+        catalog_record.published = False
+        catalog_record.published_record = None
+        catalog_record.reason = ' | '.join(evaluation.reasons)
         catalog_record.timestamp = timestamp
-        catalog_record.save()
-        Session.commit()
 
-        return catalog_record.published
+        return catalog_record, self._apply_catalog_record_changes(catalog_record, evaluation.published_md5)
+
+    @final
+    def _write_catalog_records(
+            self,
+            catalog_records: list[CatalogRecord],
+            unchanged_catalog_records: list[CatalogRecord],
+            published_dois: list[str],
+    ) -> None:
+        """Write a batch of computed catalog_record entries, record newly
+        published DOIs, and drain the corresponding queue entries. The
+        caller is responsible for committing."""
+        with self.timer.stage('write'):
+            self._save_published_dois(published_dois)
+            self._save_catalog_records(catalog_records)
+            self._touch_catalog_records(unchanged_catalog_records)
+            self._drain_queue([catalog_record.record_id for catalog_record in catalog_records + unchanged_catalog_records])
+
+    @final
+    def _save_catalog_records(self, catalog_records: list[CatalogRecord]) -> None:
+        """Insert or update a batch of catalog_record entries using a
+        single multi-row ``INSERT ... ON CONFLICT DO UPDATE`` statement."""
+        if not catalog_records:
+            return
+
+        columns = ['published', 'published_record', 'published_md5', 'doi', 'reason', 'timestamp']
+        if self.external:
+            columns += ['synced', 'error', 'error_count', 'next_attempt_at']
+        if self.indexed:
+            columns += ['full_text', 'keywords', 'facets',
+                        'spatial_north', 'spatial_east', 'spatial_south', 'spatial_west',
+                        'temporal_start', 'temporal_end']
+
+        # `changed` is the time of writing rather than of the latest record
+        # change, so that the change feed also reflects embargo transitions,
+        # and harvesters do not miss entries that are published late
+        stmt = insert(CatalogRecord).values([
+            dict(
+                catalog_id=catalog_record.catalog_id,
+                record_id=catalog_record.record_id,
+                changed=func.statement_timestamp(),
+                **{column: getattr(catalog_record, column) for column in columns},
+            ) for catalog_record in catalog_records
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['catalog_id', 'record_id'],
+            set_={column: stmt.excluded[column] for column in columns + ['changed']},
+        )
+        Session.execute(stmt)
+
+    @final
+    def _touch_catalog_records(self, catalog_records: list[CatalogRecord]) -> None:
+        """Update only the reason and timestamp of a batch of catalog_record
+        entries whose published content is unchanged."""
+        if not catalog_records:
+            return
+
+        table = CatalogRecord.__table__
+        Session.execute(
+            update(table).
+            where(table.c.catalog_id == self.catalog_id).
+            where(table.c.record_id == bindparam('b_record_id')).
+            values(reason=bindparam('b_reason'), timestamp=bindparam('b_timestamp')),
+            [
+                dict(
+                    b_record_id=catalog_record.record_id,
+                    b_reason=catalog_record.reason,
+                    b_timestamp=catalog_record.timestamp,
+                ) for catalog_record in catalog_records
+            ],
+        )
 
     def evaluate_record(self, record_model: RecordModel) -> tuple[bool, list[PublishedReason | NotPublishedReason]]:
         """Evaluate whether a record can be published.
@@ -209,12 +550,46 @@ class Publisher:
         """Create the published form of a record."""
         raise NotImplementedError
 
+    @final
+    def translate_to_datacite(self, record_model: RecordModel) -> dict[str, Any]:
+        """Return the SAEON DataCite translation of an ISO19115 record.
+
+        If the record's metadata has not been altered by embargo processing,
+        the translation stored with the record at validation time is reused,
+        provided that it was produced by the current version of the schema.
+        Otherwise, the record is translated once, the translation is shared
+        with the other publishers in the batch, and it is saved with the
+        record for reuse on subsequent runs.
+        """
+        unaltered = record_model.id in self.translations
+        if unaltered and (translation := self.translations[record_model.id]) is not None:
+            return translation
+
+        with self.timer.stage('translate'):
+            schema = Session.get(Schema, (record_model.schema_id, SchemaType.metadata))
+            iso19115_schema = schema_catalog.get_schema(URI(schema.uri))
+            result = iso19115_schema.evaluate(JSON(record_model.metadata))
+            translation = translate_to_datacite(result)
+
+        if unaltered:
+            self.translations[record_model.id] = translation
+            self.new_translations[record_model.id] = dict(
+                b_id=record_model.id,
+                b_timestamp=datetime.fromisoformat(record_model.timestamp),
+                b_translation=translation,
+                b_translation_md5=schema_md5(schema.uri),
+            )
+
+        return translation
+
     @staticmethod
-    def _process_embargoes(record_model: RecordModel) -> None:
-        """Check if a record is currently subject to an embargo and, if so, update
-        the given `record_model`, stripping out download links / embedded datasets
-        from the metadata."""
-        current_date = date.today()
+    def _process_embargoes(record_model: RecordModel, current_date: date) -> bool:
+        """Check if a record is subject to an embargo on `current_date` and, if so,
+        update the given `record_model`, stripping out download links / embedded
+        datasets from the metadata.
+
+        :return: True if the record is embargoed
+        """
         embargoed = False
 
         for tag in record_model.tags:
@@ -226,7 +601,7 @@ class Publisher:
                     break
 
         if not embargoed:
-            return
+            return False
 
         if record_model.schema_id == ODPMetadataSchema.SAEON_DATACITE_4:
             try:
@@ -248,47 +623,205 @@ class Publisher:
                 except KeyError:
                     pass
 
+        return True
+
+    @final
+    def _drain_queue(self, record_ids: list[str]) -> None:
+        """Remove catalog_record_queue entries for the given records, for
+        changes that are reflected in their (just written) catalog_record
+        entries. Changes queued after the records were selected are kept."""
+        if not record_ids:
+            return
+
+        Session.execute(
+            delete(CatalogRecordQueue).
+            where(CatalogRecordQueue.catalog_id == self.catalog_id).
+            where(CatalogRecordQueue.record_id.in_(record_ids)).
+            where(CatalogRecordQueue.timestamp <= (
+                select(CatalogRecord.timestamp).
+                where(CatalogRecord.catalog_id == CatalogRecordQueue.catalog_id).
+                where(CatalogRecord.record_id == CatalogRecordQueue.record_id).
+                scalar_subquery()
+            ))
+        )
+
     @staticmethod
-    def _save_published_doi(record_model: RecordModel) -> None:
-        """Permanently save a DOI when it is first published."""
-        if record_model.doi and not Session.get(PublishedDOI, record_model.doi):
-            published_doi = PublishedDOI(doi=record_model.doi)
-            published_doi.save()
+    def _save_published_dois(dois: list[str]) -> None:
+        """Permanently save DOIs when they are first published."""
+        if dois:
+            Session.execute(
+                insert(PublishedDOI).
+                values([dict(doi=doi, published=datetime.now(timezone.utc)) for doi in dois]).
+                on_conflict_do_nothing(index_elements=['doi'])
+            )
 
     @final
     def _sync_external(self) -> None:
-        """Synchronize with an external catalog."""
-        unsynced_catalog_records = Session.execute(
-            select(CatalogRecord).
+        """Synchronize with an external catalog.
+
+        Up to `sync_workers` records are synchronized concurrently, on
+        a thread pool. Requests are made using values loaded up front, so
+        that worker threads do not touch the database session. Records
+        are selected, synchronized, and their results written and
+        committed in batches of `batch_size`, keyed on record id, so that
+        memory use is bounded regardless of the size of the backlog.
+
+        Only unsynced records that are due - having never failed, or
+        whose next_attempt_at has passed - are selected.
+        """
+        now = datetime.now(timezone.utc)
+        stmt = (
+            select(
+                CatalogRecord.record_id,
+                Record.doi,
+                CatalogRecord.published_record,
+                CatalogRecord.error_count,
+            ).
+            join(Record).
             where(CatalogRecord.catalog_id == self.catalog_id).
             where(CatalogRecord.synced == False).
-            where(CatalogRecord.error_count < self.max_attempts)
-        ).scalars().all()
+            where(self._in_shard(CatalogRecord.record_id)).
+            where(or_(
+                CatalogRecord.next_attempt_at == None,
+                CatalogRecord.next_attempt_at <= now,
+            )).
+            order_by(CatalogRecord.record_id).
+            limit(self.batch_size)
+        )
 
-        logger.info(f'{self.catalog_id} catalog: {(total := len(unsynced_catalog_records))} records selected for external sync')
-        synced = 0
+        total = 0
+        synced_count = 0
+        last_record_id = None
 
-        for catalog_record in unsynced_catalog_records:
-            try:
-                self.sync_external_record(catalog_record.record_id)
-                catalog_record.synced = True
-                catalog_record.error = None
-                catalog_record.error_count = 0
-                synced += 1
-            except Exception as e:
-                catalog_record.error = repr(e)
-                catalog_record.error_count += 1
-
-            catalog_record.save()
-            Session.commit()
+        with ThreadPoolExecutor(max_workers=self.sync_workers) as executor:
+            while unsynced_catalog_records := Session.execute(
+                    stmt.where(CatalogRecord.record_id > last_record_id) if last_record_id else stmt
+            ).all():
+                last_record_id = unsynced_catalog_records[-1].record_id
+                total += len(unsynced_catalog_records)
+
+                futures = {
+                    executor.submit(self.sync_external_record, row.record_id, row.doi, row.published_record): row
+                    for row in unsynced_catalog_records
+                }
+                synced = []
+                errors = []
+                for future in as_completed(futures):
+                    row = futures[future]
+                    try:
+                        synced += [dict(b_record_id=row.record_id, b_external_md5=future.result())]
+                    except Exception as e:
+                        errors += [dict(
+                            b_record_id=row.record_id,
+                            b_error=repr(e),
+                            b_next_attempt_at=self._next_attempt_at(row.error_count or 0, getattr(e, 'retry_after', None)),
+                        )]
 
+                self._save_sync_results(synced, errors)
+                Session.commit()
+                synced_count += len(synced)
+
+        logger.info(f'{self.catalog_id} catalog: {total} records selected for external sync')
         if total:
-            logger.info(f'{self.catalog_id} catalog: {synced} records synced; {total - synced} errors')
+            logger.info(f'{self.catalog_id} catalog: {synced_count} records synced; {total - synced_count} errors')
+
+    @final
+    def _save_sync_results(self, synced: list[dict[str, str]], errors: list[dict[str, str]]) -> None:
+        """Update the sync status of a batch of catalog_record entries.
+
+        :param synced: a list of {'b_record_id': ..., 'b_external_md5': ...}
+            dicts for records that were successfully synced
+        :param errors: a list of {'b_record_id': ..., 'b_error': ..., 'b_next_attempt_at': ...}
+            dicts for records that could not be synced
+        """
+        table = CatalogRecord.__table__
+        if synced:
+            Session.execute(
+                update(table).
+                where(table.c.catalog_id == self.catalog_id).
+                where(table.c.record_id == bindparam('b_record_id')).
+                values(
+                    synced=True,
+                    error=None,
+                    error_count=0,
+                    next_attempt_at=None,
+                    external_md5=bindparam('b_external_md5'),
+                ),
+                synced,
+            )
+        if errors:
+            Session.execute(
+                update(table).
+                where(table.c.catalog_id == self.catalog_id).
+                where(table.c.record_id == bindparam('b_record_id')).
+                values(
+                    error=bindparam('b_error'),
+                    error_count=table.c.error_count + 1,
+                    next_attempt_at=bindparam('b_next_attempt_at'),
+                ),
+                errors,
+            )
+
+    @final
+    def _next_attempt_at(self, error_count: int, retry_after: Optional[float]) -> datetime:
+        """Calculate when to retry a failed sync, using exponential backoff
+        with jitter, and no sooner than requested by the external catalog.
 
-    def sync_external_record(self, record_id: str) -> None:
-        """Create / update / delete a record on an external catalog."""
+        :param error_count: the number of failures prior to this one
+        :param retry_after: seconds to wait, as requested by the external catalog
+        """
+        delay = min(self.retry_max_delay, self.retry_delay * 2 ** error_count)
+        delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+    def sync_external_record(
+            self,
+            record_id: str,
+            doi: Optional[str],
+            published_record: Optional[dict[str, Any]],
+    ) -> Optional[str]:
+        """Create / update / delete a record on an external catalog.
+
+        This is called concurrently from multiple threads, and
+        must not use the database session.
+
+        :param record_id: the record id
+        :param doi: the record DOI, if any
+        :param published_record: the published form of the record;
+            None if the record is not published
+        :return: a hash of the record as stored by the external catalog,
+            for later reconciliation, or None
+        """
         pass
 
+    @final
+    def _refresh_facet_counts(self) -> None:
+        """Recompute the facet counts of the catalog's published records,
+        which are served by the catalog API for unfiltered facet requests.
+
+        Counts are replaced in a single transaction, serialized among
+        publisher instances (shards) by a transaction-level advisory lock.
+        """
+        Session.execute(select(func.pg_advisory_xact_lock(func.hashtext(f'odp.facets:{self.catalog_id}'))))
+        Session.execute(
+            delete(CatalogFacetCount).
+            where(CatalogFacetCount.catalog_id == self.catalog_id)
+        )
+        counts = facet_counts(
+            CatalogRecord.catalog_id == self.catalog_id,
+            CatalogRecord.published,
+        )
+        Session.execute(
+            insert(CatalogFacetCount).
+            from_select(
+                ['catalog_id', 'facet', 'value', 'count'],
+                select(literal(self.catalog_id), counts.c.facet, counts.c.value, counts.c.count)
+            )
+        )
+        Session.commit()
+
     @final
     def _add_search_data(self, catalog_record: CatalogRecord) -> None:
         """Add pre-computed search data to a catalog record."""
@@ -298,6 +831,11 @@ class Publisher:
                 func.to_tsvector('english', self.create_full_text_search_data(published_record))
             ).scalar_subquery()
             catalog_record.keywords = self.create_keyword_search_data(published_record)
+            catalog_record.facets = [
+                f'{facet}:{value}'
+                for facet, values in (self.create_facet_search_data(published_record) or {}).items()
+                for value in values
+            ] or None
             if north_east_south_west := self.create_spatial_search_data(published_record):
                 (catalog_record.spatial_north,
                  catalog_record.spatial_east,
@@ -312,6 +850,7 @@ class Publisher:
         """Remove pre-computed search data from a catalog record."""
         catalog_record.full_text = None
         catalog_record.keywords = None
+        catalog_record.facets = None
         catalog_record.spatial_north = None
         catalog_record.spatial_east = None
         catalog_record.spatial_south = None
@@ -327,6 +866,10 @@ class Publisher:
         """Create an array of metadata keywords to be indexed for keyword search."""
         pass
 
+    def create_facet_search_data(self, published_record: PublishedRecordModel) -> dict[str, list[str]]:
+        """Create a dict of facet values, keyed by facet name, to be indexed for faceted search."""
+        pass
+
     def create_spatial_search_data(self, published_record: PublishedRecordModel) -> tuple[float, float, float, float]:
         """Create a N-E-S-W tuple of the spatial extent to be indexed for spatial search."""
         pass
@@ -334,3 +877,459 @@ class Publisher:
     def create_temporal_search_data(self, published_record: PublishedRecordModel) -> tuple[datetime, datetime]:
         """Create a start-end tuple of the temporal extent to be indexed for temporal search."""
         pass
+
+
+@final
+class MultiPublisher:
+    """Publishes to a set of catalogs in a single pass.
+
+    Candidates are selected per catalog, but each record that is a candidate
+    for any catalog is loaded, and its RecordModel built, only once per run,
+    and then evaluated and published by every publisher for which it is a
+    candidate.
+
+    Progress is journaled in publish_run / publish_run_batch. Candidates
+    are processed in record id order, and a batch completion marker is
+    committed with each batch. If a run is interrupted, the next run for
+    the same catalogs, mode and shard resumes it, provided that it is not
+    older than RESUME_MAX_AGE, skipping records in the record id ranges
+    of batches that were completed, unless they have since changed.
+
+    Records may be hash-partitioned among SHARD_COUNT publisher instances,
+    each handling the partition given by its SHARD_INDEX. All instances
+    must be configured with the same SHARD_COUNT.
+    """
+
+    def __init__(self, publishers: list[Publisher]) -> None:
+        self.publishers = publishers
+        self.batch_size = config.ODP.PUBLISH.BATCH_SIZE
+        self.workers = config.ODP.PUBLISH.WORKERS
+        self.shard_index = config.ODP.PUBLISH.SHARD_INDEX
+        self.shard_count = config.ODP.PUBLISH.SHARD_COUNT
+        self.resume_max_age = config.ODP.PUBLISH.RESUME_MAX_AGE
+        self.timer = StageTimer()  # for stages shared by all publishers
+        self.worker_peak_memory_bytes = 0
+        self.run_id = None
+
+        # each record is translated at most once per batch, for all publishers
+        self.translations = {}
+        self.new_translations = {}
+        for publisher in publishers:
+            publisher.translations = self.translations
+            publisher.new_translations = self.new_translations
+        self.completed_batches = set()
+
+    def run(self, full_scan: bool = False) -> None:
+        """Publish to every catalog that is not already being published
+        to, for this shard, by another process. Catalogs that are skipped
+        are removed from `publishers`.
+
+        Exclusion is by a PostgreSQL session-level advisory lock per
+        (catalog, shard index), held on a dedicated connection for the
+        duration of the run. The lock is released automatically if the
+        process dies.
+
+        The lock connection is in autocommit mode, so that it is not left
+        idle in a transaction for the duration of the run, where it would be
+        subject to idle_in_transaction_session_timeout, which would close
+        the connection and silently release the lock.
+        """
+        with engine.execution_options(isolation_level='AUTOCOMMIT').connect() as lock_connection:
+            locked_publishers = []
+            try:
+                for publisher in self.publishers:
+                    if lock_connection.execute(select(func.pg_try_advisory_lock(*_lock_key(publisher)))).scalar():
+                        locked_publishers += [publisher]
+                    else:
+                        logger.warning(f'{publisher.catalog_id} catalog: shard {publisher.shard_index + 1}/{publisher.shard_count} '
+                                       'is being published by another process; skipping')
+
+                self.publishers = locked_publishers
+                if self.publishers:
+                    self._run(full_scan)
+
+            finally:
+                for publisher in locked_publishers:
+                    lock_connection.execute(select(func.pg_advisory_unlock(*_lock_key(publisher))))
+
+    def _run(self, full_scan: bool) -> None:
+        candidates: dict[str, dict[str, datetime]] = {}
+        for publisher in self.publishers:
+            for record_id, timestamp in publisher._select_candidates(full_scan):
+                candidates.setdefault(record_id, {})[publisher.catalog_id] = timestamp
+
+        candidates = self._start_run(full_scan, candidates)
+
+        records = sorted(candidates.items())
+        batches = [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+        if self.workers > 1 and len(batches) > 1:
+            published, failed = self._sync_batches_parallel(batches)
+        else:
+            published, failed = {}, {}
+            for batch_index, batch in enumerate(batches):
+                batch_published, batch_failed = self._sync_catalog_records(batch, self.run_id)
+                for catalog_id, count in batch_published.items():
+                    published[catalog_id] = published.get(catalog_id, 0) + count
+                for catalog_id, count in batch_failed.items():
+                    failed[catalog_id] = failed.get(catalog_id, 0) + count
+                self._update_run(batches, batch_index)
+
+        for publisher in self.publishers:
+            total = sum(publisher.catalog_id in timestamps for timestamps in candidates.values())
+            catalog_published = published.get(publisher.catalog_id, 0)
+            catalog_failed = failed.get(publisher.catalog_id, 0)
+            catalog_hidden = total - catalog_published - catalog_failed
+            publisher.counts = dict(selected=total, published=catalog_published, hidden=catalog_hidden, failed=catalog_failed)
+            if total:
+                logger.info(f'{publisher.catalog_id} catalog: {catalog_published} records published; '
+                            f'{catalog_hidden} records hidden; {catalog_failed} records failed')
+
+        for publisher in self.publishers:
+            if publisher.indexed and publisher.counts['selected']:
+                with publisher.timer.stage('facets'):
+                    publisher._refresh_facet_counts()
+
+        for publisher in self.publishers:
+            if publisher.external:
+                with publisher.timer.stage('sync'):
+                    publisher._sync_external()
+
+        self._finish_run()
+
+    def _start_run(
+            self,
+            full_scan: bool,
+            candidates: dict[str, dict[str, datetime]],
+    ) -> dict[str, dict[str, datetime]]:
+        """Resume the latest unfinished run for this set of catalogs and
+        mode, if it was started within RESUME_MAX_AGE, or else start a
+        new run.
+
+        A candidate is skipped by a resumed run if it falls within the
+        record id range of a completed batch, and has not changed since
+        the batch was completed.
+
+        :param candidates: {record_id: {catalog_id: timestamp}}
+        :return: the candidates that remain to be processed
+        """
+        catalog_ids = sorted(publisher.catalog_id for publisher in self.publishers)
+        now = datetime.now(timezone.utc)
+        publish_run = Session.execute(
+            select(PublishRun).
+            where(PublishRun.catalog_ids == catalog_ids).
+            where(PublishRun.full_scan == full_scan).
+            where(PublishRun.shard_index == self.shard_index).
+            where(PublishRun.shard_count == self.shard_count).
+            where(PublishRun.finished == None).
+            where(PublishRun.started >= now - timedelta(seconds=self.resume_max_age)).
+            order_by(PublishRun.started.desc()).
+            limit(1)
+        ).scalar_one_or_none()
+
+        if publish_run:
+            completed_batches = Session.execute(
+                select(PublishRunBatch.first_record_id, PublishRunBatch.last_record_id, PublishRunBatch.completed).
+                where(PublishRunBatch.run_id == publish_run.id)
+            ).all()
+            candidates = {
+                record_id: timestamps for record_id, timestamps in candidates.items()
+                if not any(
+                    first <= record_id <= last and max(timestamps.values()) <= completed
+                    for first, last, completed in completed_batches
+                )
+            }
+            logger.info(f'Resuming publishing run {publish_run.id} from {publish_run.updated.isoformat()}: '
+                        f'{publish_run.completed_count} records previously completed')
+        else:
+            publish_run = PublishRun(
+                catalog_ids=catalog_ids,
+                full_scan=full_scan,
+                shard_index=self.shard_index,
+                shard_count=self.shard_count,
+                started=now,
+                completed_count=0,
+            )
+
+        publish_run.updated = now
+        publish_run.candidate_count = publish_run.completed_count + len(candidates)
+        publish_run.save()
+        self.run_id = publish_run.id
+        Session.commit()
+
+        return candidates
+
+    def _update_run(self, batches: list[list[tuple[str, dict[str, datetime]]]], batch_index: int) -> None:
+        """Record the completion of a batch in the run journal, advancing
+        the high-water mark over the longest completed prefix of batches."""
+        self.completed_batches.add(batch_index)
+        prefix = 0
+        while prefix in self.completed_batches:
+            prefix += 1
+
+        publish_run = Session.get(PublishRun, self.run_id)
+        publish_run.updated = datetime.now(timezone.utc)
+        publish_run.completed_count += len(batches[batch_index])
+        if prefix and (high_water_mark := batches[prefix - 1][-1][0]) > (publish_run.high_water_mark or ''):
+            publish_run.high_water_mark = high_water_mark
+        publish_run.save()
+        Session.commit()
+
+    def _finish_run(self) -> None:
+        publish_run = Session.get(PublishRun, self.run_id)
+        publish_run.updated = publish_run.finished = datetime.now(timezone.utc)
+        publish_run.save()
+        Session.commit()
+
+    def _sync_batches_parallel(
+            self,
+            batches: list[list[tuple[str, dict[str, datetime]]]],
+    ) -> tuple[dict[str, int], dict[str, int]]:
+        """Evaluate and publish batches of the candidate list in a pool of
+        worker processes.
+
+        Workers are spawned rather than forked, so that each one creates its
+        own database engine and scoped session. A batch that fails is logged
+        and skipped without affecting other batches; its records are left
+        untouched and will be selected again on the next run.
+
+        :return: tuple(published, failed), each being a dict of record
+            counts keyed by catalog id
+        """
+        publisher_specs = [(type(publisher), publisher.catalog_id) for publisher in self.publishers]
+        timers = {publisher.catalog_id: publisher.timer for publisher in self.publishers}
+        published = {}
+        failed = {}
+        with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+        ) as executor:
+            futures = {
+                executor.submit(_sync_batch, publisher_specs, batch, self.run_id): batch_index
+                for batch_index, batch in enumerate(batches)
+            }
+            for future in as_completed(futures):
+                try:
+                    (batch_published, batch_failed), batch_stages, shared_stages, worker_memory = future.result()
+                    self.worker_peak_memory_bytes = max(self.worker_peak_memory_bytes, worker_memory)
+                    for catalog_id, count in batch_published.items():
+                        published[catalog_id] = published.get(catalog_id, 0) + count
+                    for catalog_id, count in batch_failed.items():
+                        failed[catalog_id] = failed.get(catalog_id, 0) + count
+                    for catalog_id, stages in batch_stages.items():
+                        timers[catalog_id].merge(stages)
+                    self.timer.merge(shared_stages)
+                    self._update_run(batches, futures[future])
+                except Exception as e:
+                    batch = batches[futures[future]]
+                    for _, timestamps in batch:
+                        for catalog_id in timestamps:
+                            failed[catalog_id] = failed.get(catalog_id, 0) + 1
+                    logger.error(f'Failed to publish batch starting at record {batch[0][0]}: {e!r}')
+
+        return published, failed
+
+    def _save_translations(self) -> None:
+        """Save translations made during the batch with their records, so
+        that they need not be repeated on subsequent runs. A record that
+        has been updated since it was loaded is skipped."""
+        if not self.new_translations:
+            return
+
+        table = Record.__table__
+        Session.execute(
+            update(table).
+            where(table.c.id == bindparam('b_id')).
+            where(table.c.timestamp == bindparam('b_timestamp')).
+            values(
+                translation=bindparam('b_translation'),
+                translation_md5=bindparam('b_translation_md5'),
+            ),
+            list(self.new_translations.values()),
+        )
+
+    def _sync_catalog_records(
+            self,
+            batch: list[tuple[str, dict[str, datetime]]],
+            run_id: str = None,
+    ) -> tuple[dict[str, int], dict[str, int]]:
+        """Synchronize a batch of catalog_record entries, across all
+        catalogs, with the current state of their corresponding records.
+
+        Universal publication rules are first evaluated in SQL per catalog,
+        so that records need only be loaded, and their output models built,
+        if they pass them for at least one catalog. Records, together with
+        everything that goes into their output models, are loaded up front
+        in a handful of queries. The computed catalog_record states and any
+        newly published DOIs are written in bulk and committed in a single
+        transaction, after which the session is cleared so that memory use
+        is bounded by the batch size.
+
+        A record that fails to publish to a catalog is logged and counted,
+        and its queue entry is left in place, so that it is retried on the
+        next run; the rest of the batch is committed regardless.
+
+        :param batch: a list of (record_id, {catalog_id: timestamp}) tuples
+        :param run_id: the publish_run id, for recording batch completion
+        :return: tuple(published, failed), each being a dict of record
+            counts in the batch keyed by catalog id
+        """
+        evaluations = {}
+        for publisher in self.publishers:
+            with publisher.timer.stage('evaluate_sql'):
+                evaluations[publisher.catalog_id] = publisher._evaluate_records([
+                    record_id for record_id, timestamps in batch if publisher.catalog_id in timestamps
+                ])
+
+        candidate_ids = {
+            record_id
+            for catalog_evaluations in evaluations.values()
+            for record_id, evaluation in catalog_evaluations.items()
+            if evaluation.can_publish
+        }
+        with self.timer.stage('load'):
+            records = {
+                record.id: record
+                for record in Session.execute(
+                    select(Record).
+                    where(Record.id.in_(candidate_ids)).
+                    options(
+                        joinedload(Record.collection).
+                        selectinload(Collection.tags).
+                        options(joinedload(CollectionTag.tag), joinedload(CollectionTag.user)),
+                        selectinload(Record.tags).
+                        options(joinedload(RecordTag.tag), joinedload(RecordTag.user)),
+                        selectinload(Record.catalog_records),
+                    )
+                ).scalars()
+            } if candidate_ids else {}
+
+        current_date = Session.execute(select(func.current_date())).scalar_one()
+        catalog_records = {publisher.catalog_id: [] for publisher in self.publishers}
+        unchanged_catalog_records = {publisher.catalog_id: [] for publisher in self.publishers}
+        published_dois = {publisher.catalog_id: [] for publisher in self.publishers}
+        failed = {publisher.catalog_id: 0 for publisher in self.publishers}
+        try:
+            for record_id, timestamps in batch:
+                record = records.get(record_id)
+                record_model = None
+                publishing = [
+                    publisher for publisher in self.publishers
+                    if (evaluation := evaluations[publisher.catalog_id].get(record_id)) and evaluation.can_publish
+                ]
+                for publisher in self.publishers:
+                    catalog_id = publisher.catalog_id
+                    if not (evaluation := evaluations[catalog_id].get(record_id)):
+                        continue  # not a candidate for this catalog, or deleted since selection
+
+                    if not evaluation.can_publish:
+                        catalog_record, changed = publisher._unpublished_catalog_record(
+                            record_id, evaluation, timestamps[catalog_id],
+                        )
+
+                    elif record:
+                        # a record that cannot be published (e.g. due to a translation error, or
+                        # incomplete metadata) is left queued, and does not hold up the batch
+                        try:
+                            if record_model is None:
+                                with self.timer.stage('build'):
+                                    record_model = output_record_model(record)
+
+                            # each publisher gets its own copy of the model, since
+                            # embargo processing modifies it; the last gets the original
+                            catalog_record, changed = publisher._sync_catalog_record(
+                                record,
+                                record_model if publisher is publishing[-1] else record_model.copy(deep=True),
+                                timestamps[catalog_id],
+                                evaluation.published_md5,
+                                current_date,
+                            )
+                        except Exception as e:
+                            failed[catalog_id] += 1
+                            logger.error(f'{catalog_id} catalog: failed to publish record {record_id}: {e!r}')
+                            continue
+
+                        if catalog_record.published and record.doi:
+                            published_dois[catalog_id] += [record.doi]
+
+                    else:
+                        continue  # deleted since evaluation
+
+                    if changed:
+                        catalog_records[catalog_id] += [catalog_record]
+                    else:
+                        unchanged_catalog_records[catalog_id] += [catalog_record]
+
+            with self.timer.stage('write'):
+                self._save_translations()
+            for publisher in self.publishers:
+                catalog_id = publisher.catalog_id
+                publisher._write_catalog_records(
+                    catalog_records[catalog_id],
+                    unchanged_catalog_records[catalog_id],
+                    published_dois[catalog_id],
+                )
+            if run_id:
+                PublishRunBatch(
+                    run_id=run_id,
+                    first_record_id=batch[0][0],
+                    last_record_id=batch[-1][0],
+                    record_count=len(batch),
+                    completed=datetime.now(timezone.utc),
+                ).save()
+            with self.timer.stage('commit'):
+                Session.commit()
+
+        finally:
+            Session.expunge_all()
+            self.translations.clear()
+            self.new_translations.clear()
+
+        published = {
+            catalog_id: sum(
+                catalog_record.published
+                for catalog_record in catalog_records[catalog_id] + unchanged_catalog_records[catalog_id]
+            )
+            for catalog_id in catalog_records
+        }
+        return published, failed
+
+
+def _lock_key(publisher: Publisher) -> tuple[Any, int]:
+    """Return the (int, int) advisory lock key for a publisher's
+    catalog and shard."""
+    return func.hashtext(f'odp.publish:{publisher.catalog_id}'), publisher.shard_index
+
+
+def _published_md5(published_record: Optional[dict[str, Any]]) -> str:
+    """Return an MD5 hash of the canonical JSON serialization
+    of a published record (or of null, if not published)."""
+    return hashlib.md5(json.dumps(
+        published_record, sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    ).encode()).hexdigest()
+
+
+def _sync_batch(
+        publisher_specs: list[tuple[Type[Publisher], str]],
+        batch: list[tuple[str, dict[str, datetime]]],
+        run_id: str,
+) -> tuple[tuple[dict[str, int], dict[str, int]], dict[str, dict[str, dict[str, Any]]], dict[str, dict[str, Any]], int]:
+    """Worker process entry point for parallel publishing.
+
+    :param publisher_specs: a list of (publisher class, catalog id) tuples
+    :return: tuple((published, failed) record counts per catalog id,
+        stage timings per catalog id, shared stage timings, peak memory
+        use of the worker process)
+    """
+    try:
+        multi_publisher = MultiPublisher([
+            publisher_cls(catalog_id) for publisher_cls, catalog_id in publisher_specs
+        ])
+        published_failed = multi_publisher._sync_catalog_records(batch, run_id)
+        return (
+            published_failed,
+            {publisher.catalog_id: publisher.timer.as_dict() for publisher in multi_publisher.publishers},
+            multi_publisher.timer.as_dict(),
+            peak_memory_bytes(),
+        )
+    finally:
+        Session.remove()
@@ -1,24 +1,33 @@
-from jschon import JSON, URI
+import hashlib
+import json
+import logging
+from itertools import islice
+from typing import Any, Optional
+
+from sqlalchemy import bindparam, func, select, update
 
 from odp.api.models import PublishedDataCiteRecordModel, PublishedRecordModel, RecordModel
 from odp.db import Session
-from odp.db.models import CatalogRecord, Schema, SchemaType
+from odp.db.models import CatalogRecord, Record
 from odp.job.publish import NotPublishedReason, PublishedReason, Publisher
-from odp.lib.datacite import DataciteClient, DataciteRecordIn
-from odp.lib.schema import schema_catalog
+from odp.lib.datacite import DataciteClient, DataciteRecord, DataciteRecordIn
 from odplib.config import config
 from odplib.const import DOI_PREFIX, ODPMetadataSchema
 
+logger = logging.getLogger(__name__)
+
 
 class DataCitePublisher(Publisher):
     def __init__(self, catalog_id: str) -> None:
         super().__init__(catalog_id)
         self.external = True
+        self.doi_required = True
         self.datacite = DataciteClient(
             api_url=config.DATACITE.API_URL,
             username=config.DATACITE.USERNAME,
             password=config.DATACITE.PASSWORD,
             doi_prefix=DOI_PREFIX,
+            rate_limit=config.DATACITE.RATE_LIMIT,
         )
         self.doi_return_url = config.DATACITE.DOI_RETURN_URL
 
@@ -44,10 +53,7 @@ class DataCitePublisher(Publisher):
             datacite_metadata = record_model.metadata
 
         elif record_model.schema_id == ODPMetadataSchema.SAEON_ISO19115:
-            schema = Session.get(Schema, (record_model.schema_id, SchemaType.metadata))
-            iso19115_schema = schema_catalog.get_schema(URI(schema.uri))
-            result = iso19115_schema.evaluate(JSON(record_model.metadata))
-            datacite_metadata = result.output('translation', scheme='saeon/datacite-4', ignore_validity=True)
+            datacite_metadata = self.translate_to_datacite(record_model)
 
         else:
             raise NotImplementedError
@@ -58,10 +64,142 @@ class DataCitePublisher(Publisher):
             metadata=datacite_metadata,
         )
 
-    def sync_external_record(self, record_id: str) -> None:
+    def sync_external_record(
+            self,
+            record_id: str,
+            doi: Optional[str],
+            published_record: Optional[dict[str, Any]],
+    ) -> Optional[str]:
         """Create / update / delete a record on the DataCite platform."""
-        catalog_record = Session.get(CatalogRecord, (self.catalog_id, record_id))
-        if catalog_record.published:
-            self.datacite.publish_doi(DataciteRecordIn(**catalog_record.published_record))
-        elif doi := catalog_record.record.doi:
+        if published_record:
+            datacite_record = self.datacite.publish_doi(DataciteRecordIn(**published_record))
+            return _datacite_md5(datacite_record, published_record['metadata'])
+        elif doi:
             self.datacite.unpublish_doi(doi)
+
+    def reconcile(self) -> None:
+        """Compare the DOIs registered on DataCite with the synced
+        catalog_record entries for this catalog, and flag for re-sync
+        any entries that differ.
+
+        DataCite records are fetched a page at a time using cursor
+        pagination, and each page is compared with the catalog_record
+        entries for its DOIs. DataCite does not guarantee the order in
+        which cursor pages return DOIs, so only the DOIs seen on DataCite
+        are retained, to find published entries that are missing from
+        DataCite once all pages have been fetched.
+
+        A published record differs if it is missing from DataCite or if
+        the hash of its url, state and metadata on DataCite differs from
+        that recorded when it was last synced. An unpublished record
+        differs if it is findable on DataCite.
+
+        A published record that was synced before hashes were recorded is
+        compared directly with DataCite, and if it matches, its hash is
+        recorded rather than it being flagged for re-sync.
+        """
+        def select_local_rows(*criteria):
+            return (
+                select(
+                    CatalogRecord.record_id,
+                    func.lower(Record.doi).label('doi'),
+                    CatalogRecord.published,
+                    CatalogRecord.published_record,
+                    CatalogRecord.synced,
+                    CatalogRecord.external_md5,
+                ).
+                join(Record).
+                where(CatalogRecord.catalog_id == self.catalog_id).
+                where(Record.doi != None).
+                where(*criteria)
+            )
+
+        resync_ids = []
+        hashed = []
+        seen_dois = set()
+        checked = orphaned = 0
+        remote_records = self.datacite.iter_dois(page_size=self.batch_size)
+
+        while remote_page := {
+            remote.doi.lower(): remote
+            for remote in islice(remote_records, self.batch_size)
+        }:
+            seen_dois |= remote_page.keys()
+            matched_dois = set()
+            for local in Session.execute(select_local_rows(func.lower(Record.doi).in_(list(remote_page)))):
+                remote = remote_page[local.doi]
+                matched_dois.add(local.doi)
+                if local.synced:
+                    if local.published:
+                        datacite_md5 = _datacite_md5(remote, local.published_record['metadata'])
+                        if local.external_md5 is None and _datacite_matches(remote, local.published_record):
+                            hashed += [dict(b_record_id=local.record_id, b_external_md5=datacite_md5)]
+                        elif datacite_md5 != local.external_md5:
+                            resync_ids += [local.record_id]
+                    elif remote.metadata.get('state') == 'findable':
+                        resync_ids += [local.record_id]
+                checked += 1
+
+            for doi in remote_page.keys() - matched_dois:
+                logger.debug(f'{self.catalog_id} catalog: {remote_page[doi].doi} is not in the catalog')
+                orphaned += 1
+
+        for local in Session.execute(
+                select_local_rows(CatalogRecord.synced, CatalogRecord.published).
+                execution_options(yield_per=self.batch_size)
+        ):
+            if local.doi not in seen_dois:
+                resync_ids += [local.record_id]
+                checked += 1
+
+        for i in range(0, len(resync_ids), self.batch_size):
+            Session.execute(
+                update(CatalogRecord).
+                where(CatalogRecord.catalog_id == self.catalog_id).
+                where(CatalogRecord.record_id.in_(resync_ids[i:i + self.batch_size])).
+                values(synced=False, error=None, error_count=0, next_attempt_at=None)
+            )
+        if hashed:
+            table = CatalogRecord.__table__
+            Session.execute(
+                update(table).
+                where(table.c.catalog_id == self.catalog_id).
+                where(table.c.record_id == bindparam('b_record_id')).
+                values(external_md5=bindparam('b_external_md5')),
+                hashed,
+            )
+        Session.commit()
+
+        logger.info(f'{self.catalog_id} catalog: {checked} records reconciled; {len(resync_ids)} queued for re-sync; '
+                    f'{len(hashed)} hashes recorded; {orphaned} DOIs on DataCite not in the catalog')
+
+
+def _datacite_matches(datacite_record: DataciteRecord, published_record: dict[str, Any]) -> bool:
+    """Compare a DataCite record directly with the published record from
+    which it was synced: the url, findable state and the metadata
+    properties present in the published metadata must match. DOIs are
+    compared case-insensitively, since DataCite returns them in lower
+    case."""
+    if datacite_record.url != published_record['url'] or datacite_record.metadata.get('state') != 'findable':
+        return False
+
+    for key, value in published_record['metadata'].items():
+        remote_value = datacite_record.metadata.get(key)
+        if key == 'doi' and isinstance(value, str) and isinstance(remote_value, str):
+            value, remote_value = value.lower(), remote_value.lower()
+        if remote_value != value:
+            return False
+
+    return True
+
+
+def _datacite_md5(datacite_record: DataciteRecord, published_metadata: dict[str, Any]) -> str:
+    """Return an MD5 hash of the url, state and metadata of a DataCite
+    record, as stored on DataCite. Only metadata properties that are
+    present in our published metadata are included, so that properties
+    computed by DataCite (e.g. created, citationCount) are ignored."""
+    return hashlib.md5(json.dumps(dict(
+        url=datacite_record.url,
+        state=datacite_record.metadata.get('state'),
+        metadata={key: datacite_record.metadata.get(key) for key in published_metadata},
+    ), sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()).hexdigest()
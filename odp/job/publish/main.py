@@ -1,18 +1,28 @@
 #!/usr/bin/env python
 
+import argparse
 import logging
 import pathlib
+import selectors
 import sys
+import time
 
-from sqlalchemy import select
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import literal, select, update
+from sqlalchemy.dialects.postgresql import insert
 
 rootdir = pathlib.Path(__file__).parent.parent.parent.parent
 sys.path.append(str(rootdir))
 
-from odp.db import Session
-from odp.db.models import Catalog
+from odp.db import Session, engine
+from odp.db.models import Catalog, CatalogRecord, CatalogRecordQueue, PublishRun
+from odp.db.models.catalog_record_queue import NOTIFY_CHANNEL
+from odp.job.publish import MultiPublisher
 from odp.job.publish.datacite import DataCitePublisher
+from odp.job.publish.report import PublishReport
 from odp.job.publish.saeon import SAEONPublisher
+from odplib.config import config
 from odplib.const import ODPCatalog
 from odplib.logging import init_logging
 
@@ -26,18 +36,198 @@ publishers = {
 }
 
 
-def main():
+def main(full_scan: bool = False):
     logger.info('PUBLISHING STARTED')
+    report = PublishReport()
     try:
-        for catalog_id in Session.execute(select(Catalog.id)).scalars():
-            publisher = publishers[catalog_id]
-            publisher(catalog_id).run()
+        multi_publisher = MultiPublisher([
+            publishers[catalog_id](catalog_id)
+            for catalog_id in Session.execute(select(Catalog.id)).scalars().all()
+        ])
+        try:
+            multi_publisher.run(full_scan)
+        finally:
+            for publisher in multi_publisher.publishers:
+                report.add_catalog(publisher.catalog_id, publisher.counts, publisher.timer)
+            report.add_shared(multi_publisher.timer, multi_publisher.worker_peak_memory_bytes)
 
         logger.info('PUBLISHING FINISHED')
 
     except Exception as e:
         logger.critical(f'PUBLISHING ABORTED: {str(e)}')
 
+    finally:
+        Session.remove()
+        if config.ODP.PUBLISH.REPORT_DIR:
+            try:
+                report.write(config.ODP.PUBLISH.REPORT_DIR)
+            except OSError as e:
+                logger.error(f'Failed to write publishing report: {str(e)}')
+
+
+def requeue_failed(catalog_id: str = None):
+    """Make all records that have failed to sync to an external
+    catalog due for immediate retry, resetting their backoff."""
+    stmt = (
+        update(CatalogRecord).
+        where(CatalogRecord.synced == False).
+        where(CatalogRecord.error_count > 0).
+        values(error_count=0, next_attempt_at=None)
+    )
+    if catalog_id:
+        stmt = stmt.where(CatalogRecord.catalog_id == catalog_id)
+
+    count = Session.execute(stmt).rowcount
+    Session.commit()
+    logger.info(f'{count} failed records requeued for external sync')
+
+
+def reindex(catalog_id: str = None):
+    """Queue the published records of indexed catalogs for re-evaluation,
+    forcing their catalog_record entries, along with any pre-computed
+    search data, to be rewritten by the next publishing run."""
+    for catalog_id in ([catalog_id] if catalog_id else Session.execute(select(Catalog.id)).scalars().all()):
+        if not publishers[catalog_id](catalog_id).indexed:
+            continue
+
+        Session.execute(
+            update(CatalogRecord).
+            where(CatalogRecord.catalog_id == catalog_id).
+            where(CatalogRecord.published).
+            values(published_md5=None)
+        )
+        count = Session.execute(
+            insert(CatalogRecordQueue).
+            from_select(
+                ['catalog_id', 'record_id', 'timestamp'],
+                select(literal(catalog_id), CatalogRecord.record_id, CatalogRecord.timestamp).
+                where(CatalogRecord.catalog_id == catalog_id).
+                where(CatalogRecord.published)
+            ).
+            on_conflict_do_nothing(index_elements=['catalog_id', 'record_id'])
+        ).rowcount
+        Session.commit()
+        logger.info(f'{catalog_id} catalog: {count} records queued for reindexing')
+
+
+def reconcile():
+    """Reconcile external catalogs with their catalog_record entries,
+    flagging records that differ for re-sync on the next run."""
+    for catalog_id in Session.execute(select(Catalog.id)).scalars().all():
+        publisher = publishers[catalog_id](catalog_id)
+        if hasattr(publisher, 'reconcile'):
+            try:
+                publisher.reconcile()
+            except Exception as e:
+                logger.error(f'{catalog_id} catalog: reconciliation failed: {e!r}')
+
+
+def list_runs():
+    """Print the journal entries of unfinished (in-progress or
+    interrupted) publishing runs."""
+    for publish_run in Session.execute(
+            select(PublishRun).
+            where(PublishRun.finished == None).
+            order_by(PublishRun.started)
+    ).scalars():
+        print(f'{publish_run.id}: catalogs={",".join(publish_run.catalog_ids)} '
+              f'full_scan={publish_run.full_scan} '
+              f'shard={publish_run.shard_index + 1}/{publish_run.shard_count} '
+              f'started={publish_run.started.isoformat()} '
+              f'updated={publish_run.updated.isoformat()} '
+              f'completed={publish_run.completed_count}/{publish_run.candidate_count} '
+              f'high_water_mark={publish_run.high_water_mark}')
+
+
+def daemon():
+    """Run the publisher as a long-running process.
+
+    Publishing is triggered by notifications sent when records are queued
+    by the catalog_record_queue triggers. Notifications are coalesced by
+    waiting for DEBOUNCE seconds of quiet, up to MAX_DELAY seconds, so
+    that bursts of changes are published in a single run. A full scan is
+    run at startup and every SWEEP_INTERVAL seconds thereafter.
+    """
+    logger.info('PUBLISHING DAEMON STARTED')
+    while True:
+        try:
+            _listen()
+        except psycopg2.OperationalError as e:
+            logger.error(f'Lost connection to the database: {str(e)}')
+            time.sleep(config.ODP.PUBLISH.DEBOUNCE)
+
+
+def _listen():
+    # a dedicated connection, outside of the pool, on which to listen
+    connection = engine.raw_connection()
+    connection.detach()
+    dbapi_connection = connection.dbapi_connection
+    dbapi_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    with dbapi_connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+
+    selector = selectors.DefaultSelector()
+    selector.register(dbapi_connection, selectors.EVENT_READ)
+
+    def wait(timeout: float) -> bool:
+        """Wait up to `timeout` seconds for notifications, discarding
+        any received; return True if any were received."""
+        if timeout > 0 and selector.select(timeout):
+            dbapi_connection.poll()
+        notified = bool(dbapi_connection.notifies)
+        dbapi_connection.notifies.clear()
+        return notified
+
+    try:
+        # publishing is triggered by a notification or a scheduled full scan;
+        # the latter includes any changes made while we were not listening
+        next_sweep = time.monotonic()
+        while True:
+            if time.monotonic() >= next_sweep:
+                wait(0)
+                main(full_scan=True)
+                next_sweep = time.monotonic() + config.ODP.PUBLISH.SWEEP_INTERVAL
+
+            elif wait(next_sweep - time.monotonic()):
+                deadline = time.monotonic() + config.ODP.PUBLISH.MAX_DELAY
+                while wait(min(config.ODP.PUBLISH.DEBOUNCE, deadline - time.monotonic())):
+                    pass
+                main()
+
+    finally:
+        selector.close()
+        connection.close()
+
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Publish records to ODP catalogs.')
+    parser.add_argument('--full-scan', action='store_true',
+                        help='compare every record with its catalog_record entries, instead of '
+                             'selecting only records queued by the catalog_record_queue triggers')
+    parser.add_argument('--daemon', action='store_true',
+                        help='run continuously, publishing changes as they are notified, '
+                             'with a periodic full scan')
+    parser.add_argument('--requeue-failed', metavar='CATALOG_ID', nargs='?', const='', default=None,
+                        help='reset the retry backoff of records that have failed to sync to an external '
+                             'catalog (all external catalogs if CATALOG_ID is omitted), and exit')
+    parser.add_argument('--reindex', metavar='CATALOG_ID', nargs='?', const='', default=None,
+                        help='queue published records for rewriting of their search data by the next '
+                             'publishing run (all indexed catalogs if CATALOG_ID is omitted), and exit')
+    parser.add_argument('--runs', action='store_true',
+                        help='list unfinished publishing runs, and exit')
+    parser.add_argument('--reconcile', action='store_true',
+                        help='compare external catalogs with their catalog_record entries, '
+                             'flag records that differ for re-sync, and exit')
+    args = parser.parse_args()
+    if args.runs:
+        list_runs()
+    elif args.reconcile:
+        reconcile()
+    elif args.requeue_failed is not None:
+        requeue_failed(args.requeue_failed or None)
+    elif args.reindex is not None:
+        reindex(args.reindex or None)
+    elif args.daemon:
+        daemon()
+    else:
+        main(args.full_scan)
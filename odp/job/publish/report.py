@@ -0,0 +1,178 @@
+import json
+import os
+import resource
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+
+class StageTimer:
+    """Accumulates wall time and call counts per named stage of
+    a publishing run.
+
+    Time spent in a stage that is nested within another (e.g. 'translate'
+    within 'publish') is counted only towards the inner stage, so that
+    stage totals do not overlap.
+    """
+
+    def __init__(self) -> None:
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._nested_seconds = []  # per open stage, time spent in stages nested within it
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        self._nested_seconds.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds[name] += elapsed - self._nested_seconds.pop()
+            self.calls[name] += 1
+            if self._nested_seconds:
+                self._nested_seconds[-1] += elapsed
+
+    def merge(self, stages: dict[str, dict[str, Any]]) -> None:
+        """Add in stage totals returned by :meth:`as_dict`, e.g.
+        from a worker process."""
+        for name, totals in stages.items():
+            self.seconds[name] += totals['seconds']
+            self.calls[name] += totals['calls']
+
+    def as_dict(self) -> dict[str, dict[str, Any]]:
+        return {
+            name: dict(seconds=round(self.seconds[name], 6), calls=self.calls[name])
+            for name in self.seconds
+        }
+
+
+class PublishReport:
+    """Timing and throughput report for a publishing run, covering
+    all catalogs.
+
+    Peak memory is measured from the creation of the report where the
+    platform allows the peak to be reset (Linux), and is otherwise the
+    peak since the process started; `peak_memory_scope` is 'run' or
+    'process' accordingly. Worker processes are started per run, so
+    their peaks are always per run.
+    """
+
+    def __init__(self) -> None:
+        self.started = datetime.now(timezone.utc)
+        self.start_time = time.perf_counter()
+        self.peak_memory_scope = 'run' if reset_peak_memory() else 'process'
+        self.worker_peak_memory_bytes = 0
+        self.catalogs = {}
+        self.shared_stages = {}
+
+    def add_catalog(self, catalog_id: str, counts: dict[str, int], timer: StageTimer) -> None:
+        self.catalogs[catalog_id] = dict(counts, stages=timer.as_dict())
+
+    def add_shared(self, timer: StageTimer, worker_peak_memory_bytes: int = 0) -> None:
+        """Add timings of stages shared by all catalogs, such as
+        record loading and model building, and the peak memory use
+        of any worker processes."""
+        self.shared_stages = timer.as_dict()
+        self.worker_peak_memory_bytes = worker_peak_memory_bytes
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(
+            started=self.started.isoformat(),
+            duration=round(time.perf_counter() - self.start_time, 6),
+            peak_memory_bytes=max(peak_memory_bytes(), self.worker_peak_memory_bytes),
+            peak_memory_scope=self.peak_memory_scope,
+            shared_stages=self.shared_stages,
+            catalogs=self.catalogs,
+        )
+
+    def write(self, report_dir: str) -> None:
+        """Write the report to `report_dir` as publish-report.json and,
+        in Prometheus text exposition format, as publish-report.prom.
+
+        Files are replaced atomically, so that the .prom file may be
+        picked up by the node exporter's textfile collector.
+        """
+        report = self.as_dict()
+        _write_atomic(Path(report_dir) / 'publish-report.json', json.dumps(report, indent=4))
+        _write_atomic(Path(report_dir) / 'publish-report.prom', _prometheus_text(report))
+
+
+def reset_peak_memory() -> bool:
+    """Reset the peak resident set size of this process, where
+    supported (Linux).
+
+    :return: True if the peak was reset
+    """
+    try:
+        Path('/proc/self/clear_refs').write_text('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_bytes() -> int:
+    """Return the peak resident set size of this process, since the
+    last call to :func:`reset_peak_memory` where supported, or else
+    since the process started."""
+    try:
+        for line in Path('/proc/self/status').read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return 1024 * int(line.split()[1])
+    except OSError:
+        pass
+
+    # ru_maxrss is in kilobytes on Linux
+    return 1024 * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _prometheus_text(report: dict[str, Any]) -> str:
+    lines = []
+
+    def metric(name, help_, samples):
+        lines.extend([f'# HELP {name} {help_}', f'# TYPE {name} gauge'])
+        for labels, value in samples:
+            label_str = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f'{name}{{{label_str}}} {value}' if label_str else f'{name} {value}')
+
+    metric('odp_publish_last_run_timestamp_seconds', 'Start time of the last publishing run.',
+           [({}, datetime.fromisoformat(report['started']).timestamp())])
+    metric('odp_publish_duration_seconds', 'Wall time of the last publishing run.',
+           [({}, report['duration'])])
+    metric('odp_publish_peak_memory_bytes', 'Peak resident set size during the last publishing run '
+                                            '(scope="process" if measured since the publisher process started).',
+           [(dict(scope=report['peak_memory_scope']), report['peak_memory_bytes'])])
+    metric('odp_publish_records', 'Number of records processed per catalog, by outcome.', [
+        (dict(catalog=catalog_id, outcome=outcome), count)
+        for catalog_id, catalog in report['catalogs'].items()
+        for outcome, count in catalog.items() if outcome != 'stages'
+    ])
+
+    # stages shared by all catalogs are labelled catalog="shared"
+    stages = [
+        (catalog_id, stage, totals)
+        for catalog_id, catalog in report['catalogs'].items()
+        for stage, totals in catalog['stages'].items()
+    ] + [
+        ('shared', stage, totals)
+        for stage, totals in report['shared_stages'].items()
+    ]
+    metric('odp_publish_stage_seconds', 'Wall time spent in each publishing stage.', [
+        (dict(catalog=catalog_id, stage=stage), totals['seconds'])
+        for catalog_id, stage, totals in stages
+    ])
+    metric('odp_publish_stage_calls', 'Number of calls to each publishing stage.', [
+        (dict(catalog=catalog_id, stage=stage), totals['calls'])
+        for catalog_id, stage, totals in stages
+    ])
+
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
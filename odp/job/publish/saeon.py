@@ -1,12 +1,7 @@
 from datetime import datetime
 
-from jschon import JSON, URI
-
 from odp.api.models import PublishedMetadataModel, PublishedRecordModel, PublishedSAEONRecordModel, PublishedTagInstanceModel, RecordModel
-from odp.db import Session
-from odp.db.models import Schema, SchemaType
 from odp.job.publish import Publisher
-from odp.lib.schema import schema_catalog
 from odplib.const import ODPMetadataSchema
 
 
@@ -27,8 +22,7 @@ class SAEONPublisher(Publisher):
             timestamp=record_model.timestamp,
         )
 
-    @staticmethod
-    def _create_published_metadata(record_model: RecordModel) -> list[PublishedMetadataModel]:
+    def _create_published_metadata(self, record_model: RecordModel) -> list[PublishedMetadataModel]:
         """Create the published metadata outputs for a record."""
         published_metadata = [
             PublishedMetadataModel(
@@ -38,14 +32,10 @@ class SAEONPublisher(Publisher):
         ]
 
         if record_model.schema_id == ODPMetadataSchema.SAEON_ISO19115:
-            schema = Session.get(Schema, (record_model.schema_id, SchemaType.metadata))
-            iso19115_schema = schema_catalog.get_schema(URI(schema.uri))
-            result = iso19115_schema.evaluate(JSON(record_model.metadata))
-            datacite_metadata = result.output('translation', scheme='saeon/datacite-4', ignore_validity=True)
             published_metadata += [
                 PublishedMetadataModel(
                     schema_id=ODPMetadataSchema.SAEON_DATACITE_4,
-                    metadata=datacite_metadata,
+                    metadata=self.translate_to_datacite(record_model),
                 )
             ]
 
@@ -66,11 +56,7 @@ class SAEONPublisher(Publisher):
     def create_full_text_search_data(self, published_record: PublishedSAEONRecordModel) -> str:
         """Create a string from metadata field values to be indexed for full text search."""
         values = []
-        datacite_metadata = next((
-            published_metadata.metadata
-            for published_metadata in published_record.metadata
-            if published_metadata.schema_id == ODPMetadataSchema.SAEON_DATACITE_4
-        ))
+        datacite_metadata = self._get_datacite_metadata(published_record)
 
         for title in datacite_metadata.get('titles', ()):
             if title_text := title.get('title'):
@@ -105,12 +91,72 @@ class SAEONPublisher(Publisher):
 
     def create_keyword_search_data(self, published_record: PublishedSAEONRecordModel) -> list[str]:
         """Create an array of metadata keywords to be indexed for keyword search."""
-        pass
+        datacite_metadata = self._get_datacite_metadata(published_record)
+        keywords = {}
+        for subject in datacite_metadata.get('subjects', ()):
+            if subject_text := (subject.get('subject') or '').strip():
+                keywords.setdefault(subject_text.casefold(), subject_text)
+
+        return list(keywords.values()) or None
+
+    def create_facet_search_data(self, published_record: PublishedSAEONRecordModel) -> dict[str, list[str]]:
+        """Create a dict of facet values, keyed by facet name, to be indexed for faceted search."""
+        datacite_metadata = self._get_datacite_metadata(published_record)
+        facets = {'collection': [published_record.collection_id]}
+
+        if publisher := datacite_metadata.get('publisher'):
+            facets['publisher'] = [publisher]
+
+        if publication_year := datacite_metadata.get('publicationYear'):
+            facets['year'] = [str(publication_year)]
+
+        if resource_type := datacite_metadata.get('types', {}).get('resourceTypeGeneral'):
+            facets['type'] = [resource_type]
+
+        return facets
 
     def create_spatial_search_data(self, published_record: PublishedSAEONRecordModel) -> tuple[float, float, float, float]:
-        """Create a N-E-S-W tuple of the spatial extent to be indexed for spatial search."""
-        pass
+        """Create a N-E-S-W tuple of the spatial extent to be indexed for spatial search.
+
+        The extent is the bounding box of all the DataCite geoLocations
+        boxes, points and polygons. A box that crosses the antimeridian
+        (west > east) extends the extent to all longitudes.
+        """
+        datacite_metadata = self._get_datacite_metadata(published_record)
+        latitudes = []
+        longitudes = []
+
+        def add_point(point):
+            latitudes.append(float(point['pointLatitude']))
+            longitudes.append(float(point['pointLongitude']))
+
+        for geo_location in datacite_metadata.get('geoLocations', ()):
+            if box := geo_location.get('geoLocationBox'):
+                latitudes += [float(box['northBoundLatitude']), float(box['southBoundLatitude'])]
+                if float(box['westBoundLongitude']) > float(box['eastBoundLongitude']):
+                    longitudes += [-180.0, 180.0]
+                else:
+                    longitudes += [float(box['westBoundLongitude']), float(box['eastBoundLongitude'])]
+
+            if point := geo_location.get('geoLocationPoint'):
+                add_point(point)
+
+            for polygon in geo_location.get('geoLocationPolygons', ()):
+                for point in polygon.get('polygonPoints', ()):
+                    add_point(point)
+
+        if latitudes:
+            return max(latitudes), max(longitudes), min(latitudes), min(longitudes)
 
     def create_temporal_search_data(self, published_record: PublishedSAEONRecordModel) -> tuple[datetime, datetime]:
         """Create a start-end tuple of the temporal extent to be indexed for temporal search."""
         pass
+
+    @staticmethod
+    def _get_datacite_metadata(published_record: PublishedSAEONRecordModel) -> dict:
+        """Get the DataCite metadata of a published record."""
+        return next((
+            published_metadata.metadata
+            for published_metadata in published_record.metadata
+            if published_metadata.schema_id == ODPMetadataSchema.SAEON_DATACITE_4
+        ))
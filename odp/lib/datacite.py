@@ -1,4 +1,9 @@
-from typing import Any, Optional
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Iterator, Optional
+from urllib.parse import parse_qs, urlparse
 
 import requests
 from pydantic import AnyHttpUrl, BaseModel, Field
@@ -26,6 +31,37 @@ class DataciteRecordList(BaseModel):
     records: list[DataciteRecord]
 
 
+class RateLimiter:
+    """A thread-safe limiter that spaces out successive calls to
+    :meth:`wait` so as not to exceed `rate` calls per second."""
+
+    _host_limiters: dict[str, 'RateLimiter'] = {}
+    _host_limiters_lock = threading.Lock()
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_host(cls, url: str, rate: float) -> 'RateLimiter':
+        """Return the limiter shared by all clients of the host in `url`."""
+        host = urlparse(url).netloc
+        with cls._host_limiters_lock:
+            if host not in cls._host_limiters:
+                cls._host_limiters[host] = cls(rate)
+            return cls._host_limiters[host]
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
 class DataciteClient:
 
     def __init__(
@@ -34,12 +70,19 @@ class DataciteClient:
             doi_prefix: str,
             username: str,
             password: str,
+            rate_limit: float = None,
     ):
+        """
+        :param rate_limit: (optional) the maximum number of requests per second
+            to be sent to the DataCite API host, across all client instances
+            and threads in this process
+        """
         self.api_url = api_url
         self.doi_prefix = doi_prefix
         self.username = username
         self.password = password
         self.timeout = 60.0
+        self.rate_limiter = RateLimiter.for_host(api_url, rate_limit) if rate_limit else None
 
     def list_dois(self, page_size: int, page_num: int) -> DataciteRecordList:
         """
@@ -47,9 +90,8 @@ class DataciteClient:
         our configured prefix.
 
         Note: Using DataCite's ``page[number]`` query parameter we can fetch a
-        maximum of 10,000 records in total. If this limit becomes problematic,
-        we will have to switch to using the ``page[cursor]`` query parameter.
-        DataCite's pagination methods are described here:
+        maximum of 10,000 records in total. To iterate over all records, use
+        :meth:`iter_dois`. DataCite's pagination methods are described here:
         https://support.datacite.org/docs/pagination
 
         :param page_size: the number of records to be returned per page
@@ -72,6 +114,37 @@ class DataciteClient:
             this_page=result['meta']['page'],
         )
 
+    def iter_dois(self, page_size: int = 1000) -> Iterator[DataciteRecord]:
+        """
+        Iterate over all metadata records on DataCite which have a DOI
+        matching our configured prefix.
+
+        Records are fetched a page at a time using DataCite's cursor-based
+        pagination (``page[cursor]``), which has no limit on the total number
+        of records. The order of records across cursor pages is not
+        guaranteed, and callers must not depend on it. Iteration ends on a
+        page without a ``next`` link or without any records.
+
+        :param page_size: the number of records to be fetched per request
+        """
+        cursor = '1'
+        while cursor:
+            result = self._request('GET', '/dois/', params={
+                'query': f'id:{self.doi_prefix}/*',
+                'page[size]': page_size,
+                'page[cursor]': cursor,
+            })
+
+            yield from (DataciteRecord(
+                doi=item['id'],
+                url=item['attributes']['url'],
+                metadata=item['attributes'],
+            ) for item in result['data'])
+
+            cursor = None
+            if result['data'] and (next_link := result.get('links', {}).get('next')):
+                cursor = parse_qs(urlparse(next_link).query).get('page[cursor]', [None])[0]
+
     def get_doi(self, doi: str) -> DataciteRecord:
         """
         Fetch a metadata record from DataCite.
@@ -134,6 +207,8 @@ class DataciteClient:
             headers['Accept'] = 'application/vnd.api+json'
         if method in ('POST', 'PUT'):
             headers['Content-Type'] = 'application/vnd.api+json'
+        if self.rate_limiter:
+            self.rate_limiter.wait()
         try:
             r = requests.request(method, self.api_url + path, **kwargs,
                                  auth=(self.username, self.password),
@@ -148,7 +223,26 @@ class DataciteClient:
                 error_detail = e.response.json()
             except ValueError:
                 error_detail = e.response.reason
-            raise DataciteError(status_code=e.response.status_code, error_detail=error_detail) from e
+            raise DataciteError(
+                status_code=e.response.status_code,
+                error_detail=error_detail,
+                retry_after=_parse_retry_after(e.response.headers.get('Retry-After')),
+            ) from e
 
         except requests.RequestException as e:
             raise DataciteError(status_code=503) from e
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the number of seconds specified by a Retry-After header,
+    which may be given as a number of seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
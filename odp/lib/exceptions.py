@@ -84,6 +84,7 @@ class HydraAdminError(ODPException):
 class DataciteError(ODPException):
     """ Exception raised when a request to the DataCite API fails """
 
-    def __init__(self, status_code, error_detail=None):
+    def __init__(self, status_code, error_detail=None, retry_after=None):
         self.status_code = status_code
         self.error_detail = error_detail
+        self.retry_after = retry_after  # seconds, from a Retry-After response header
@@ -1,7 +1,9 @@
 import hashlib
 import re
 from datetime import datetime
+from functools import cache
 from pathlib import Path
+from typing import Any
 from urllib.parse import urlparse
 
 from jschon import JSON, JSONSchemaError, LocalSource, URI, create_catalog
@@ -60,12 +62,19 @@ schema_catalog.create_metaschema(
 )
 
 
+@cache
 def schema_md5(uri: str) -> str:
     """Return an MD5 hash of the (serialized) schema identified by uri."""
     schema = schema_catalog.get_schema(URI(uri))
     return hashlib.md5(str(schema).encode()).hexdigest()
 
 
+def translate_to_datacite(result: Result) -> dict[str, Any]:
+    """Return the SAEON DataCite 4 translation of the metadata
+    evaluated against the SAEON ISO19115 schema."""
+    return result.output('translation', scheme='saeon/datacite-4', ignore_validity=True)
+
+
 @translation_filter('date-to-year')
 def date_to_year(date: str) -> int:
     return datetime.strptime(date, '%Y-%m-%d').year
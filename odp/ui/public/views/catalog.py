@@ -1,3 +1,5 @@
+from urllib.parse import quote
+
 from flask import Blueprint, render_template, request
 
 from odp.ui.public.forms import SearchForm
@@ -12,17 +14,25 @@ bp = Blueprint('catalog', __name__)
 def index():
     page = request.args.get('page', 1)
     text_q = request.args.get('q')
+    facet = request.args.getlist('facet')
 
     api_filter = ''
     ui_filter = ''
     if text_q:
         api_filter += f'&text_q={text_q}'
         ui_filter += f'&q={text_q}'
+    for facet_filter in facet:
+        api_filter += f'&facet={quote(facet_filter)}'
+        ui_filter += f'&facet={quote(facet_filter)}'
 
-    records = api.get(f'/catalog/SAEON/records?page={page}{api_filter}')
+    sort = '&sort=relevance' if text_q else ''
+    records = api.get(f'/catalog/SAEON/records?page={page}{api_filter}{sort}')
+    facets = api.get(f'/catalog/SAEON/facets?size=10{api_filter}')
     return render_template(
         'record_list.html',
         records=records,
+        facets=facets,
+        selected_facets=facet,
         filter_=ui_filter,
         search_form=SearchForm(request.args),
     )
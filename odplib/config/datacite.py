@@ -14,3 +14,4 @@ class DataciteConfig(BaseConfig):
     USERNAME: str  # DataCite account username
     PASSWORD: str  # DataCite account password
     DOI_RETURN_URL: AnyHttpUrl  # base URL for DOI back-links
+    RATE_LIMIT: float = 10.0  # maximum number of requests per second sent by the publisher
@@ -40,6 +40,9 @@ class ODPAPIConfig(BaseConfig):
     # catalog UI base URL; published DOIs resolve here
     CATALOG_UI_URL: AnyHttpUrl
 
+    # (optional) number of seconds for which published records may be cached by clients and proxies
+    CACHE_MAX_AGE: int = 300
+
 
 class ODPUIAdminConfig(BaseConfig, OAuth2ClientConfigMixin):
     class Config:
@@ -113,6 +116,24 @@ class ODPMailConfig(BaseConfig):
     PASSWORD: str = None  # sender password
 
 
+class ODPPublishConfig(BaseConfig):
+    class Config:
+        env_prefix = 'ODP_PUBLISH_'
+
+    BATCH_SIZE: int = 1000  # number of records evaluated, and committed, per database transaction
+    WORKERS: int = 1        # number of worker processes used for evaluating records; 1 = no worker processes
+    SYNC_WORKERS: int = 4   # maximum number of concurrent requests to an external catalog
+    SYNC_RETRY_DELAY: int = 60  # seconds before the first retry of a failed external sync; doubled on each failure
+    SYNC_RETRY_MAX_DELAY: int = 86400  # maximum seconds between retries of a failed external sync
+    DEBOUNCE: float = 2.0   # daemon mode: seconds of quiet to wait for after a change notification before publishing
+    MAX_DELAY: float = 10.0  # daemon mode: maximum seconds by which publishing may be delayed by debouncing
+    SWEEP_INTERVAL: int = 3600  # daemon mode: seconds between full scans
+    RESUME_MAX_AGE: int = 21600  # seconds since its start within which an interrupted run may be resumed; older runs are started afresh
+    SHARD_COUNT: int = 1    # number of publisher instances among which records are partitioned by a hash of the record id
+    SHARD_INDEX: int = 0    # the partition (0 .. SHARD_COUNT-1) handled by this publisher instance
+    REPORT_DIR: str = None  # directory to which timing reports (JSON and Prometheus text format) are written after each run
+
+
 class ODPConfig(BaseConfig):
     class Config:
         env_prefix = 'ODP_'
@@ -127,4 +148,5 @@ class ODPConfig(BaseConfig):
         'CLI': ODPCLIConfig,
         'IDENTITY': ODPIdentityConfig,
         'MAIL': ODPMailConfig,
+        'PUBLISH': ODPPublishConfig,
     }
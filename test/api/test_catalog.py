@@ -1,13 +1,20 @@
+import gzip
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
 from random import randint
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import func, select, update
+from starlette.requests import Request
 
-from odplib.const import ODPScope
+from odplib.const import ODPCatalog, ODPMetadataSchema, ODPScope
+from odp.api.lib.cache import not_modified
 from odp.db import Session
-from odp.db.models import Catalog
+from odp.db.models import Catalog, CatalogFacetCount, CatalogRecord, CatalogRecordTombstone
 from test.api import all_scopes, all_scopes_excluding, assert_forbidden, assert_not_found
-from test.factories import CatalogFactory
+from test.factories import CatalogFactory, RecordFactory
 
 
 @pytest.fixture
@@ -16,6 +23,40 @@ def catalog_batch():
     return [CatalogFactory() for _ in range(randint(3, 5))]
 
 
+def create_published_record(catalog, title, description='', changed=None, **search_data):
+    """Create and commit a record published to the SAEON catalog, with
+    the given title and description indexed for full text search, and
+    any other catalog_record search data."""
+    record = RecordFactory()
+    published_record = dict(
+        id=record.id,
+        doi=record.doi,
+        sid=record.sid,
+        collection_id=record.collection_id,
+        metadata=[dict(
+            schema_id=ODPMetadataSchema.SAEON_DATACITE_4.value,
+            metadata={'titles': [{'title': title}], 'descriptions': [{'description': description}]},
+        )],
+        tags=[],
+        timestamp=record.timestamp.isoformat(),
+    )
+    catalog_record = CatalogRecord(
+        catalog_id=catalog.id,
+        record_id=record.id,
+        published=True,
+        published_record=published_record,
+        published_md5=hashlib.md5(repr(published_record).encode()).hexdigest(),
+        doi=record.doi,
+        timestamp=record.timestamp,
+        changed=changed or record.timestamp,
+        full_text=func.to_tsvector('english', f'{title} {description}'),
+        **search_data,
+    )
+    catalog_record.save()
+    Session.commit()
+    return catalog_record
+
+
 def assert_db_state(catalogs):
     """Verify that the DB catalog table contains the given catalog batch."""
     Session.expire_all()
@@ -76,3 +117,447 @@ def test_get_catalog_not_found(api, catalog_batch):
     r = api(scopes).get('/catalog/foo')
     assert_not_found(r)
     assert_db_state(catalog_batch)
+
+
+@pytest.mark.parametrize('scopes', [
+    [ODPScope.CATALOG_READ],
+    [],
+    all_scopes,
+    all_scopes_excluding(ODPScope.CATALOG_READ),
+])
+def test_export_catalog(api, catalog_batch, scopes):
+    authorized = ODPScope.CATALOG_READ in scopes
+    r = api(scopes).get(f'/catalog/{catalog_batch[2].id}/export')
+    if authorized:
+        assert r.status_code == 200
+        assert r.headers['content-type'] == 'application/x-ndjson'
+        assert r.text == ''
+    else:
+        assert_forbidden(r)
+    assert_db_state(catalog_batch)
+
+
+@pytest.mark.parametrize('accept_encoding, compressed', [
+    (None, False),
+    ('gzip', True),
+    ('deflate, gzip;q=0.5', True),
+    ('gzip;q=0', False),
+    ('br', False),
+])
+def test_export_catalog_records(api, accept_encoding, compressed):
+    catalog = CatalogFactory(id=ODPCatalog.SAEON)
+    catalog_records = [create_published_record(catalog, f'Record {n}') for n in range(3)]
+    create_published_record(CatalogFactory(), 'Another catalog')
+
+    r = api([ODPScope.CATALOG_READ]).get(
+        f'/catalog/{catalog.id}/export',
+        headers={'Accept-Encoding': accept_encoding} if accept_encoding else {},
+        stream=True,
+    )
+    assert r.status_code == 200
+    assert r.headers['content-type'] == 'application/x-ndjson'
+    assert r.headers['vary'] == 'Accept-Encoding'
+    assert r.headers.get('content-encoding') == ('gzip' if compressed else None)
+
+    content = r.raw.read(decode_content=False)
+    if compressed:
+        content = gzip.decompress(content)
+    lines = content.decode().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        catalog_record.published_record
+        for catalog_record in sorted(catalog_records, key=lambda c: c.record_id)
+    ]
+
+
+def test_export_catalog_not_found(api, catalog_batch):
+    scopes = [ODPScope.CATALOG_READ]
+    r = api(scopes).get('/catalog/foo/export')
+    assert_not_found(r)
+    assert_db_state(catalog_batch)
+
+
+@pytest.mark.parametrize('scopes', [
+    [ODPScope.CATALOG_READ],
+    [],
+    all_scopes,
+    all_scopes_excluding(ODPScope.CATALOG_READ),
+])
+def test_list_published_record_changes(api, catalog_batch, scopes):
+    authorized = ODPScope.CATALOG_READ in scopes
+    r = api(scopes).get(f'/catalog/{catalog_batch[2].id}/changes', params={'from': '2000-01-01T00:00:00Z'})
+    if authorized:
+        assert r.status_code == 200
+        assert r.json()['items'] == []
+    else:
+        assert_forbidden(r)
+    assert_db_state(catalog_batch)
+
+
+@pytest.fixture
+def record_changes():
+    """Create and commit a published entry, an unpublished entry and a
+    tombstone on successive days, in the SAEON catalog, together with a
+    change that is too recent to be listed, and a change in another
+    catalog; return the catalog and the first three changes."""
+    catalog = CatalogFactory(id=ODPCatalog.SAEON)
+    day = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+    published = create_published_record(catalog, 'Published', changed=day + timedelta(days=1))
+
+    record = RecordFactory()
+    unpublished = CatalogRecord(
+        catalog_id=catalog.id,
+        record_id=record.id,
+        published=False,
+        published_md5=hashlib.md5(b'null').hexdigest(),
+        reason='QC failed',
+        timestamp=record.timestamp,
+        changed=day + timedelta(days=2),
+    )
+    unpublished.save()
+
+    deleted = CatalogRecordTombstone(
+        catalog_id=catalog.id,
+        record_id='deleted-record-id',
+        doi='10.5555/deleted',
+        changed=day + timedelta(days=3),
+    )
+    deleted.save()
+    Session.commit()
+
+    create_published_record(catalog, 'Too recent', changed=datetime.now(timezone.utc))
+    create_published_record(CatalogFactory(), 'Another catalog', changed=day + timedelta(days=1))
+
+    return catalog, [published, unpublished, deleted]
+
+
+@pytest.mark.parametrize('params, expected', [
+    ({}, [0, 1, 2]),
+    ({'from': '2022-01-03T00:00:00+00:00'}, [1, 2]),
+    ({'until': '2022-01-04T00:00:00+00:00'}, [0, 1]),
+    ({'from': '2022-01-03T00:00:00+00:00', 'until': '2022-01-04T00:00:00+00:00'}, [1]),
+    ({'from': '2022-01-04T00:00:01+00:00'}, []),
+])
+def test_list_published_record_changes_feed(api, record_changes, params, expected):
+    catalog, changes = record_changes
+    r = api([ODPScope.CATALOG_READ]).get(f'/catalog/{catalog.id}/changes', params=params)
+    assert r.status_code == 200
+    items = r.json()['items']
+    assert [item['record_id'] for item in items] == [changes[i].record_id for i in expected]
+
+    for item in items:
+        change = changes[[c.record_id for c in changes].index(item['record_id'])]
+        assert datetime.fromisoformat(item['changed']) == change.changed
+        if isinstance(change, CatalogRecordTombstone):
+            assert (item['published'], item['deleted'], item['doi']) == (False, True, change.doi)
+            assert item['published_record'] is None
+        elif change.published:
+            assert (item['published'], item['deleted'], item['doi']) == (True, False, change.doi)
+            assert item['published_record']['id'] == change.record_id
+        else:
+            assert (item['published'], item['deleted']) == (False, False)
+            assert item['published_record'] is None
+
+
+def test_list_published_record_changes_cursor(api, record_changes):
+    catalog, changes = record_changes
+    client = api([ODPScope.CATALOG_READ])
+    record_ids = []
+    cursor = None
+    while True:
+        r = client.get(f'/catalog/{catalog.id}/changes', params={'size': 1} | ({'cursor': cursor} if cursor else {}))
+        assert r.status_code == 200
+        assert len(r.json()['items']) <= 1
+        record_ids += [item['record_id'] for item in r.json()['items']]
+        if not (cursor := r.json()['next_cursor']):
+            break
+
+    assert record_ids == [change.record_id for change in changes]
+
+
+@pytest.mark.parametrize('scopes', [
+    [ODPScope.CATALOG_READ],
+    [],
+    all_scopes,
+    all_scopes_excluding(ODPScope.CATALOG_READ),
+])
+def test_list_published_record_facets(api, catalog_batch, scopes):
+    authorized = ODPScope.CATALOG_READ in scopes
+    r = api(scopes).get(f'/catalog/{catalog_batch[2].id}/facets', params={'facet': 'year:2021'})
+    if authorized:
+        assert r.status_code == 200
+        assert r.json() == {'collection': {}, 'keyword': {}, 'publisher': {}, 'year': {}, 'type': {}}
+    else:
+        assert_forbidden(r)
+    assert_db_state(catalog_batch)
+
+
+def test_list_published_records_invalid_facet(api, catalog_batch):
+    r = api([ODPScope.CATALOG_READ]).get(f'/catalog/{catalog_batch[2].id}/records', params={'facet': 'colour:red'})
+    assert r.status_code == 422
+    assert r.json() == {'detail': 'Invalid facet filter: colour:red'}
+    assert_db_state(catalog_batch)
+
+
+@pytest.fixture
+def faceted_records():
+    """Create and commit records published to the SAEON catalog, with
+    facet values and keywords."""
+    catalog = CatalogFactory(id=ODPCatalog.SAEON)
+    return catalog, [
+        create_published_record(catalog, 'Rainfall 2020', facets=['collection:c1', 'year:2020', 'type:Dataset'], keywords=['rain', 'soil']),
+        create_published_record(catalog, 'Rainfall 2021', facets=['collection:c1', 'year:2021', 'type:Dataset'], keywords=['rain']),
+        create_published_record(catalog, 'Ocean 2021', facets=['collection:c2', 'year:2021', 'type:Image'], keywords=['ocean']),
+    ]
+
+
+@pytest.mark.parametrize('params, result', [
+    ([], {
+        'collection': {'c1': 2, 'c2': 1},
+        'keyword': {'rain': 2, 'ocean': 1, 'soil': 1},
+        'publisher': {},
+        'year': {'2021': 2, '2020': 1},
+        'type': {'Dataset': 2, 'Image': 1},
+    }),
+    ([('facet', 'year:2021')], {
+        'collection': {'c1': 1, 'c2': 1},
+        'keyword': {'ocean': 1, 'rain': 1},
+        'publisher': {},
+        'year': {'2021': 2},
+        'type': {'Dataset': 1, 'Image': 1},
+    }),
+    ([('size', 1)], {
+        'collection': {'c1': 2},
+        'keyword': {'rain': 2},
+        'publisher': {},
+        'year': {'2021': 2},
+        'type': {'Dataset': 2},
+    }),
+])
+def test_list_published_record_facet_counts(api, faceted_records, params, result):
+    catalog, _ = faceted_records
+    r = api([ODPScope.CATALOG_READ]).get(f'/catalog/{catalog.id}/facets', params=params)
+    assert r.status_code == 200
+    assert r.json() == result
+    for facet, counts in result.items():
+        assert list(r.json()[facet]) == list(counts)
+
+
+@pytest.mark.parametrize('params, result', [
+    ([], {
+        'collection': {'c1': 5},
+        'keyword': {'rain': 4, 'soil': 3},
+        'publisher': {},
+        'year': {'2021': 5},
+        'type': {},
+    }),
+    ([('size', 1)], {
+        'collection': {'c1': 5},
+        'keyword': {'rain': 4},
+        'publisher': {},
+        'year': {'2021': 5},
+        'type': {},
+    }),
+    ([('facet', 'year:2021')], {
+        'collection': {'c1': 1, 'c2': 1},
+        'keyword': {'ocean': 1, 'rain': 1},
+        'publisher': {},
+        'year': {'2021': 2},
+        'type': {'Dataset': 1, 'Image': 1},
+    }),
+    ([('text_q', 'rainfall')], {
+        'collection': {'c1': 2},
+        'keyword': {'rain': 2, 'soil': 1},
+        'publisher': {},
+        'year': {'2020': 1, '2021': 1},
+        'type': {'Dataset': 2},
+    }),
+])
+def test_list_published_record_precomputed_facet_counts(api, faceted_records, params, result):
+    """Unfiltered requests are served from the counts computed by the
+    publisher; filtered requests are counted on the fly."""
+    catalog, _ = faceted_records
+    Session.add_all([
+        CatalogFacetCount(catalog_id=catalog.id, facet=facet, value=value, count=count)
+        for facet, value, count in [
+            ('collection', 'c1', 5),
+            ('keyword', 'rain', 4),
+            ('keyword', 'soil', 3),
+            ('year', '2021', 5),
+        ]
+    ])
+    Session.commit()
+    r = api([ODPScope.CATALOG_READ]).get(f'/catalog/{catalog.id}/facets', params=params)
+    assert r.status_code == 200
+    assert r.json() == result
+    for facet, counts in result.items():
+        assert list(r.json()[facet]) == list(counts)
+
+
+@pytest.mark.parametrize('facets, expected', [
+    (['year:2020', 'year:2021'], [0, 1, 2]),
+    (['year:2021', 'type:Dataset'], [1]),
+    (['keyword:soil', 'keyword:ocean'], [0, 2]),
+    (['keyword:rain', 'collection:c2'], []),
+    (['keyword:rain', 'year:2020', 'year:2021', 'type:Dataset'], [0, 1]),
+])
+def test_list_published_records_by_facet(api, faceted_records, facets, expected):
+    catalog, catalog_records = faceted_records
+    r = api([ODPScope.CATALOG_READ]).get(f'/catalog/{catalog.id}/records', params=[('facet', f) for f in facets])
+    assert r.status_code == 200
+    assert r.json()['total'] == len(expected)
+    assert set(item['id'] for item in r.json()['items']) == set(catalog_records[i].record_id for i in expected)
+
+
+@pytest.mark.parametrize('bbox, detail', [
+    ('17,-35,19', 'Invalid bbox: expecting west,south,east,north'),
+    ('17,-33,19,-35', 'Invalid bbox: coordinates out of range'),
+    ('-190,-35,19,-33', 'Invalid bbox: coordinates out of range'),
+])
+def test_list_published_records_invalid_bbox(api, catalog_batch, bbox, detail):
+    r = api([ODPScope.CATALOG_READ]).get(f'/catalog/{catalog_batch[2].id}/records', params={'bbox': bbox})
+    assert r.status_code == 422
+    assert r.json() == {'detail': detail}
+    assert_db_state(catalog_batch)
+
+
+@pytest.mark.parametrize('bbox, bbox_match, expected', [
+    ('17,-35,20,-32', 'intersect', ['cape_town', 'south_africa']),
+    ('17,-35,20,-32', 'contain', ['cape_town']),
+    ('10,-40,40,-10', 'contain', ['cape_town', 'south_africa']),
+    ('10,10,20,20', 'intersect', []),
+    ('170,-25,-170,-10', 'intersect', ['fiji', 'tonga']),
+    ('170,-25,-170,-10', 'contain', ['fiji', 'tonga']),
+    ('178,-25,-170,-10', 'intersect', ['fiji', 'tonga']),
+    ('178,-25,-170,-10', 'contain', ['tonga']),
+])
+def test_list_published_records_by_bbox(api, bbox, bbox_match, expected):
+    catalog = CatalogFactory(id=ODPCatalog.SAEON)
+    catalog_records = {
+        name: create_published_record(
+            catalog, name, spatial_north=north, spatial_east=east, spatial_south=south, spatial_west=west,
+        ) for name, (north, east, south, west) in {
+            'cape_town': (-33.5, 18.9, -34.4, 18.3),
+            'south_africa': (-22.1, 32.9, -34.8, 16.5),
+            'fiji': (-16.0, 179.5, -19.0, 177.0),
+            'tonga': (-15.5, -173.5, -22.0, -176.0),
+        }.items()
+    }
+    create_published_record(catalog, 'no spatial extent')
+
+    r = api([ODPScope.CATALOG_READ]).get(f'/catalog/{catalog.id}/records', params={'bbox': bbox, 'bbox_match': bbox_match})
+    assert r.status_code == 200
+    assert r.json()['total'] == len(expected)
+    assert set(item['id'] for item in r.json()['items']) == set(catalog_records[name].record_id for name in expected)
+
+
+def test_list_published_records_by_relevance(api):
+    catalog = CatalogFactory(id=ODPCatalog.SAEON)
+    best = create_published_record(catalog, 'Rainfall', 'Daily rainfall, with rainfall totals and rainfall maps')
+    good = create_published_record(catalog, 'Soil moisture', 'Soil moisture following rainfall')
+    create_published_record(catalog, 'Ocean temperature', 'Sea surface temperature')
+
+    scopes = [ODPScope.CATALOG_READ]
+    params = {'text_q': 'rainfall', 'sort': 'relevance', 'highlight': True, 'size': 1}
+    r = api(scopes).get(f'/catalog/{catalog.id}/records', params=params)
+    assert r.status_code == 200
+    json = r.json()
+    assert json['total'] == 2
+    assert [item['id'] for item in json['items']] == [best.record_id]
+    assert '<b>rainfall</b>' in json['items'][0]['highlight'].lower()
+    assert json['next_cursor']
+
+    r = api(scopes).get(f'/catalog/{catalog.id}/records', params=params | {'cursor': json['next_cursor']})
+    assert r.status_code == 200
+    json = r.json()
+    assert [item['id'] for item in json['items']] == [good.record_id]
+    assert '<b>rainfall</b>' in json['items'][0]['highlight'].lower()
+    assert json['next_cursor'] is None
+
+
+@pytest.mark.parametrize('headers, etag, last_modified, result', [
+    ({}, '"a"', datetime(2022, 1, 1, tzinfo=timezone.utc), False),
+    ({'If-None-Match': '"a"'}, '"a"', None, True),
+    ({'If-None-Match': '"b"'}, '"a"', None, False),
+    ({'If-None-Match': '"b", W/"a"'}, '"a"', None, True),
+    ({'If-None-Match': '"a"'}, 'W/"a"', None, True),
+    ({'If-None-Match': '*'}, '"a"', None, True),
+    ({'If-None-Match': '"a"'}, None, None, False),
+    ({'If-Modified-Since': 'Sat, 01 Jan 2022 00:00:00 GMT'}, None, datetime(2022, 1, 1, 0, 0, 0, 500000, tzinfo=timezone.utc), True),
+    ({'If-Modified-Since': 'Sat, 01 Jan 2022 00:00:00 GMT'}, None, datetime(2022, 1, 1, 0, 0, 1, tzinfo=timezone.utc), False),
+    ({'If-Modified-Since': 'not a date'}, None, datetime(2022, 1, 1, tzinfo=timezone.utc), False),
+    ({'If-None-Match': '"b"', 'If-Modified-Since': 'Sat, 01 Jan 2022 00:00:00 GMT'}, '"a"', datetime(2022, 1, 1, tzinfo=timezone.utc), False),
+])
+def test_not_modified(headers, etag, last_modified, result):
+    request = Request({
+        'type': 'http',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+    assert not_modified(request, etag, last_modified) is result
+
+
+def test_get_published_record_conditional(api):
+    catalog = CatalogFactory(id=ODPCatalog.SAEON)
+    catalog_record = create_published_record(catalog, 'Rainfall')
+    client = api([ODPScope.CATALOG_READ])
+    url = f'/catalog/{catalog.id}/records/{catalog_record.record_id}'
+
+    r = client.get(url)
+    assert r.status_code == 200
+    assert r.json()['id'] == catalog_record.record_id
+    assert r.headers['ETag'] == f'"{catalog_record.published_md5}"'
+    assert r.headers['Last-Modified'] == format_datetime(catalog_record.changed.astimezone(timezone.utc), usegmt=True)
+    assert r.headers['Cache-Control'].startswith('public, max-age=')
+    etag = r.headers['ETag']
+    last_modified = r.headers['Last-Modified']
+
+    r = client.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert r.headers['ETag'] == etag
+    assert r.content == b''
+
+    r = client.get(url, headers={'If-Modified-Since': last_modified})
+    assert r.status_code == 304
+
+    # an embargo transition rewrites the published record, without
+    # changing the timestamp of the record
+    Session.execute(
+        update(CatalogRecord).
+        where(CatalogRecord.catalog_id == catalog.id).
+        where(CatalogRecord.record_id == catalog_record.record_id).
+        values(published_md5='embargoed', changed=catalog_record.changed + timedelta(days=1))
+    )
+    Session.commit()
+
+    r = client.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert r.headers['ETag'] == '"embargoed"'
+
+    r = client.get(url, headers={'If-Modified-Since': last_modified})
+    assert r.status_code == 200
+    assert r.headers['Last-Modified'] != last_modified
+
+
+def test_list_published_records_conditional(api):
+    catalog = CatalogFactory(id=ODPCatalog.SAEON)
+    create_published_record(catalog, 'Rainfall')
+    client = api([ODPScope.CATALOG_READ])
+    url = f'/catalog/{catalog.id}/records'
+
+    r = client.get(url)
+    assert r.status_code == 200
+    assert len(r.json()['items']) == 1
+    assert r.headers['ETag'].startswith('W/"')
+    assert r.headers['Cache-Control'].startswith('public, max-age=')
+    etag = r.headers['ETag']
+
+    r = client.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert r.headers['ETag'] == etag
+    assert r.content == b''
+
+    create_published_record(catalog, 'Soil moisture')
+    r = client.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert len(r.json()['items']) == 2
+    assert r.headers['ETag'] != etag
@@ -1,9 +1,13 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
 from random import randint
 
 import pytest
+from fastapi import HTTPException
 from sqlalchemy import select
 
 from odplib.const import ODPScope
+from odp.api.lib.paging import Paginator, TotalMode
 from odp.db import Session
 from odp.db.models import Provider
 from test.api import all_scopes, all_scopes_excluding, assert_conflict, assert_empty_result, assert_forbidden, assert_not_found
@@ -71,6 +75,69 @@ def test_list_providers(api, provider_batch, scopes):
     assert_db_state(provider_batch)
 
 
+@pytest.mark.parametrize('sort', ['id', 'name'])
+def test_list_providers_cursor(api, provider_batch, sort):
+    scopes = [ODPScope.PROVIDER_READ]
+    items = []
+    cursor = None
+    while True:
+        params = {'size': 2, 'sort': sort} | ({'cursor': cursor} if cursor else {})
+        r = api(scopes).get('/provider/', params=params)
+        assert r.status_code == 200
+        json = r.json()
+        assert len(json['items']) <= 2
+        items += json['items']
+        if not (cursor := json['next_cursor']):
+            break
+
+    assert [item[sort] for item in items] == sorted(item[sort] for item in items)
+    assert_json_results(r, dict(items=items, total=json['total']), provider_batch)
+    assert_db_state(provider_batch)
+
+
+@pytest.mark.parametrize('total', ['exact', 'estimate', 'none'])
+def test_list_providers_total(api, provider_batch, total):
+    scopes = [ODPScope.PROVIDER_READ]
+    r = api(scopes).get('/provider/', params={'size': 2, 'total': total})
+    assert r.status_code == 200
+    json = r.json()
+    assert len(json['items']) == 2
+    if total == 'exact':
+        assert json['total'] == len(provider_batch)
+        assert json['pages'] == (len(provider_batch) + 1) // 2
+    elif total == 'estimate':
+        # planner statistics may be stale, so only the type is certain
+        assert isinstance(json['total'], int)
+    else:
+        assert json['total'] is json['pages'] is None
+    assert_db_state(provider_batch)
+
+
+@pytest.mark.parametrize('values', [
+    ['abc', 1, 2.5, None],
+    [datetime(2022, 3, 4, 5, 6, 7, 890, tzinfo=timezone.utc), 'abc'],
+    [date(2022, 3, 4), 'abc'],
+    [Decimal('-33.9250'), 'abc'],
+])
+def test_cursor_round_trip(values):
+    cursor = Paginator(page=1, size=2, sort='x', cursor=None, total=TotalMode.NONE)._encode_cursor(values)
+    assert Paginator(page=1, size=2, sort='x', cursor=cursor, total=TotalMode.NONE)._decode_cursor(len(values)) == values
+
+
+def test_cursor_unsupported_value():
+    with pytest.raises(HTTPException) as exc_info:
+        Paginator(page=1, size=2, sort='x', cursor=None, total=TotalMode.NONE)._encode_cursor([object()])
+    assert exc_info.value.status_code == 422
+
+
+def test_list_providers_invalid_cursor(api, provider_batch):
+    scopes = [ODPScope.PROVIDER_READ]
+    r = api(scopes).get('/provider/', params={'cursor': 'foo'})
+    assert r.status_code == 422
+    assert r.json() == {'detail': 'Invalid cursor'}
+    assert_db_state(provider_batch)
+
+
 @pytest.mark.parametrize('scopes', [
     [ODPScope.PROVIDER_READ],
     [],
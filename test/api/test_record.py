@@ -3,11 +3,13 @@ from datetime import datetime
 from random import randint
 
 import pytest
+from jschon import JSON, URI
 from sqlalchemy import select
 
-from odplib.const import ODPCollectionTag, ODPScope
+from odplib.const import ODPCollectionTag, ODPMetadataSchema, ODPRecordTag, ODPScope
 from odp.db import Session
 from odp.db.models import CollectionTag, PublishedDOI, Record, RecordAudit, RecordTag, RecordTagAudit, Scope, ScopeType
+from odp.lib.schema import schema_catalog, schema_md5, translate_to_datacite
 from test.api import (CollectionAuth, all_scopes, all_scopes_excluding, assert_conflict, assert_empty_result, assert_forbidden, assert_new_timestamp,
                       assert_not_found, assert_unprocessable)
 from test.factories import CollectionFactory, CollectionTagFactory, RecordFactory, RecordTagFactory, SchemaFactory, TagFactory
@@ -900,3 +902,55 @@ def test_untag_record(api, record_batch_no_tags, admin_route, scopes, collection
 
     assert_db_state(record_batch_no_tags)
     assert_no_audit_log()
+
+
+@pytest.mark.parametrize('data, detail', [
+    ({'start': '2021-02-30', 'end': None}, 'Invalid embargo start date'),
+    ({'start': '2021-01-01', 'end': '31/12/2021'}, 'Invalid embargo end date'),
+])
+def test_tag_record_invalid_embargo_date(api, record_batch_no_tags, data, detail):
+    tag = TagFactory(
+        id=ODPRecordTag.EMBARGO,
+        type='record',
+        cardinality='multi',
+        scope=Session.get(
+            Scope, (ODPScope.RECORD_QC, ScopeType.odp)
+        ) or Scope(
+            id=ODPScope.RECORD_QC, type=ScopeType.odp
+        ),
+        schema=SchemaFactory(
+            type='tag',
+            uri='https://odp.saeon.ac.za/schema/tag/record/embargo',
+        ),
+    )
+    r = api([ODPScope.RECORD_QC]).post(
+        f'/record/{(record_id := record_batch_no_tags[2].id)}/tag',
+        json=dict(tag_id=tag.id, data=data),
+    )
+    assert_unprocessable(r, detail)
+    assert_db_tag_state(record_id)
+    assert_tag_audit_log()
+
+
+def test_create_iso19115_record_translation(api):
+    schema = SchemaFactory(
+        id=ODPMetadataSchema.SAEON_ISO19115,
+        type='metadata',
+        uri='https://odp.saeon.ac.za/schema/metadata/saeon/iso19115',
+    )
+    collection = CollectionFactory()
+    metadata = schema_catalog.load_json(URI('https://odp.saeon.ac.za/schema/metadata/saeon/iso19115-example'))
+
+    r = api([ODPScope.RECORD_WRITE]).post('/record/', json=dict(
+        doi=metadata['doi'],
+        collection_id=collection.id,
+        schema_id=schema.id,
+        metadata=metadata,
+    ))
+
+    assert r.status_code == 200
+    Session.expire_all()
+    record = Session.get(Record, r.json()['id'])
+    result = schema_catalog.get_schema(URI(schema.uri)).evaluate(JSON(record.metadata_))
+    assert record.translation == translate_to_datacite(result)
+    assert record.translation_md5 == schema_md5(schema.uri)
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+from sqlalchemy import select
+
+from odp.db import Session
+from odp.db.models import CatalogRecord
+from odp.job.publish.datacite import DataCitePublisher, _datacite_md5
+from odp.lib.datacite import DataciteClient, DataciteRecord, RateLimiter, _parse_retry_after
+from odp.lib.exceptions import DataciteError
+from test.factories import CatalogFactory, RecordFactory
+
+API_URL = 'https://api.datacite.test'
+
+
+def datacite_page(dois, next_cursor=None, state='findable', metadata=None):
+    """Return a mock response for a page of the DataCite /dois/ endpoint."""
+    result = {
+        'data': [{
+            'id': doi,
+            'attributes': dict(metadata or {}, doi=doi, url=f'https://odp.test/{doi}', state=state),
+        } for doi in dois],
+        'links': {'next': f'{API_URL}/dois/?page%5Bcursor%5D={next_cursor}&page%5Bsize%5D=2'} if next_cursor else {},
+    }
+    return Mock(content=b'-', json=Mock(return_value=result))
+
+
+def test_iter_dois():
+    client = DataciteClient(api_url=API_URL, doi_prefix='10.5555', username='user', password='pass')
+    with patch('odp.lib.datacite.requests.request', side_effect=[
+        datacite_page(['10.5555/c', '10.5555/a'], next_cursor='abc'),
+        datacite_page(['10.5555/b'], next_cursor='def'),
+        datacite_page([], next_cursor='ghi'),
+    ]) as request:
+        assert [record.doi for record in client.iter_dois(page_size=2)] == ['10.5555/c', '10.5555/a', '10.5555/b']
+
+    assert [call.kwargs['params']['page[cursor]'] for call in request.call_args_list] == ['1', 'abc', 'def']
+    assert all(call.kwargs['params']['page[size]'] == 2 for call in request.call_args_list)
+
+
+def test_reconcile():
+    """Reconciliation must not depend on the order in which DataCite
+    returns DOIs, which is not sorted across cursor pages."""
+    catalog = CatalogFactory()
+    metadata = {'titles': [{'title': 'Test'}]}
+
+    def published_record(doi):
+        return {'doi': doi, 'url': f'https://odp.test/{doi.lower()}', 'metadata': dict(metadata, doi=doi)}
+
+    def remote_record(doi):
+        return DataciteRecord(doi=doi.lower(), url=f'https://odp.test/{doi.lower()}',
+                              metadata=dict(metadata, doi=doi.lower(), state='findable'))
+
+    def catalog_record(name, published=True, external_md5=None):
+        record = RecordFactory(doi=f'10.5555/TEST-{name}')
+        CatalogRecord(
+            catalog_id=catalog.id,
+            record_id=record.id,
+            published=published,
+            published_record=published_record(record.doi) if published else None,
+            timestamp=record.timestamp,
+            synced=True,
+            external_md5=external_md5,
+        ).save()
+        return record.id
+
+    unchanged_id = catalog_record('A', external_md5=_datacite_md5(remote_record('10.5555/TEST-A'), dict(metadata, doi='10.5555/TEST-A')))
+    changed_id = catalog_record('B', external_md5='stale')
+    unhashed_id = catalog_record('C')
+    missing_id = catalog_record('D', external_md5='any')
+    unpublished_id = catalog_record('E', published=False)
+    Session.commit()
+
+    with patch('odp.lib.datacite.requests.request', side_effect=[
+        datacite_page(['10.5555/test-e', '10.5555/test-c'], next_cursor='abc', metadata=metadata),
+        datacite_page(['10.5555/test-b', '10.5555/test-orphan', '10.5555/test-a'], metadata=metadata),
+    ]):
+        publisher = DataCitePublisher(catalog.id)
+        publisher.datacite.api_url = API_URL
+        publisher.datacite.rate_limiter = None
+        publisher.batch_size = 2
+        publisher.reconcile()
+
+    Session.expire_all()
+    result = {
+        row.record_id: (row.synced, row.external_md5)
+        for row in Session.execute(select(CatalogRecord).where(CatalogRecord.catalog_id == catalog.id)).scalars()
+    }
+    assert result[unchanged_id][0] is True
+    assert result[changed_id][0] is False
+    assert result[unhashed_id] == (True, _datacite_md5(remote_record('10.5555/TEST-C'), dict(metadata, doi='10.5555/TEST-C')))
+    assert result[missing_id][0] is False
+    assert result[unpublished_id][0] is False
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('', None),
+    ('120', 120.0),
+    ('1.5', 1.5),
+    ('-5', 0.0),
+    ('soon', None),
+    (format_datetime(datetime(2000, 1, 1, tzinfo=timezone.utc), usegmt=True), 0.0),
+])
+def test_parse_retry_after(value, expected):
+    assert _parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(minutes=10)
+    assert 590 <= _parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 600
+
+
+def test_request_retry_after():
+    response = Mock(status_code=429, reason='Too Many Requests', headers={'Retry-After': '30'})
+    response.json.side_effect = ValueError
+    response.raise_for_status.side_effect = requests.HTTPError(response=response)
+
+    client = DataciteClient(api_url=API_URL, doi_prefix='10.5555', username='user', password='pass')
+    with patch('odp.lib.datacite.requests.request', return_value=response):
+        with pytest.raises(DataciteError) as exc_info:
+            client.get_doi('10.5555/test')
+
+    assert (exc_info.value.status_code, exc_info.value.error_detail, exc_info.value.retry_after) == (429, 'Too Many Requests', 30.0)
+
+
+def test_rate_limiter():
+    """Successive calls are spaced out by the interval implied by the
+    rate, and a pause resets the schedule."""
+    rate_limiter = RateLimiter(rate=10)
+    with (
+        patch('odp.lib.datacite.time.monotonic', side_effect=[100.0, 100.0, 100.05, 200.0]),
+        patch('odp.lib.datacite.time.sleep') as sleep,
+    ):
+        for _ in range(4):
+            rate_limiter.wait()
+
+    assert [call.args[0] for call in sleep.call_args_list] == pytest.approx([0.1, 0.15])
+
+
+def test_rate_limiter_for_host():
+    rate_limiter = RateLimiter.for_host('https://api.datacite.test/dois', 5)
+    assert RateLimiter.for_host('https://api.datacite.test/other', 5) is rate_limiter
+    assert RateLimiter.for_host('https://other.datacite.test/dois', 5) is not rate_limiter
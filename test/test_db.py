@@ -1,10 +1,13 @@
-from sqlalchemy import select
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
 
 import migrate.systemdata
-from odplib.const import ODPScope
+from odplib.const import ODPRecordTag, ODPScope
 from odp.db import Session
-from odp.db.models import (Catalog, Client, ClientScope, Collection, CollectionTag, Provider, Record, RecordTag, Role,
-                           RoleScope, Schema, Scope, ScopeType, Tag, User, UserRole, Vocabulary, VocabularyTerm)
+from odp.db.models import (Catalog, CatalogRecord, CatalogRecordQueue, CatalogRecordTombstone, Client, ClientScope, Collection, CollectionTag,
+                           EmbargoSchedule, Provider, PublishRun, PublishRunBatch, Record, RecordTag, Role, RoleScope, Schema, Scope, ScopeType, Tag,
+                           User, UserRole, Vocabulary, VocabularyTerm)
 from test.factories import (CatalogFactory, ClientFactory, CollectionFactory, CollectionTagFactory, ProviderFactory, RecordFactory,
                             RecordTagFactory, RoleFactory, SchemaFactory, ScopeFactory, TagFactory, UserFactory, VocabularyFactory)
 
@@ -82,6 +85,94 @@ def test_create_record():
            == (record.id, record.doi, record.sid, record.metadata_, record.validity, record.collection.id, record.schema.id, record.schema.type)
 
 
+def test_catalog_record_queue():
+    catalogs = CatalogFactory.create_batch(2)
+    record = RecordFactory()
+    result = Session.execute(select(CatalogRecordQueue)).scalars()
+    assert sorted((row.catalog_id, row.record_id, row.timestamp) for row in result) \
+           == sorted((catalog.id, record.id, record.timestamp) for catalog in catalogs)
+
+    record.collection.timestamp = datetime.now(timezone.utc)
+    record.collection.save()
+    Session.commit()
+    result = Session.execute(select(CatalogRecordQueue)).scalars()
+    assert sorted((row.catalog_id, row.record_id, row.timestamp) for row in result) \
+           == sorted((catalog.id, record.id, record.collection.timestamp) for catalog in catalogs)
+
+    catalog = CatalogFactory()
+    result = Session.execute(select(CatalogRecordQueue).where(CatalogRecordQueue.catalog_id == catalog.id)).scalar_one()
+    assert (result.record_id, result.timestamp) == (record.id, record.timestamp)
+
+
+def test_catalog_record_tombstone():
+    catalog = CatalogFactory()
+    record = RecordFactory()
+    CatalogRecord(catalog_id=catalog.id, record_id=record.id, published=True, doi=record.doi, timestamp=record.timestamp).save()
+    Session.commit()
+    assert Session.execute(select(CatalogRecordTombstone)).first() is None
+
+    Session.execute(delete(Record).where(Record.id == record.id))
+    Session.commit()
+    result = Session.execute(select(CatalogRecordTombstone)).scalar_one()
+    assert (result.catalog_id, result.record_id, result.doi) == (catalog.id, record.id, record.doi)
+
+
+def test_embargo_schedule():
+    catalog = CatalogFactory()
+    today = date.today()
+    record_tag = RecordTagFactory(
+        tag=TagFactory(id=ODPRecordTag.EMBARGO, type='record'),
+        data={'start': str(today - timedelta(days=1)), 'end': str(today + timedelta(days=9))},
+    )
+    result = Session.execute(select(EmbargoSchedule)).scalars()
+    assert [(row.catalog_id, row.record_tag_id, row.record_id, row.date) for row in result] \
+           == [(catalog.id, record_tag.id, record_tag.record.id, today + timedelta(days=10))]
+
+    record_tag.data = {'start': str(today + timedelta(days=1)), 'end': None}
+    record_tag.save()
+    Session.commit()
+    result = Session.execute(select(EmbargoSchedule)).scalars()
+    assert [(row.catalog_id, row.record_tag_id, row.record_id, row.date) for row in result] \
+           == [(catalog.id, record_tag.id, record_tag.record.id, today + timedelta(days=1))]
+
+
+def test_embargo_schedule_malformed_date():
+    """A malformed embargo date is ignored rather than failing the tag write."""
+    catalog = CatalogFactory()
+    today = date.today()
+    record_tag = RecordTagFactory(
+        tag=TagFactory(id=ODPRecordTag.EMBARGO, type='record'),
+        data={'start': 'next week', 'end': str(today + timedelta(days=9))},
+    )
+    result = Session.execute(select(EmbargoSchedule)).scalars()
+    assert [(row.catalog_id, row.record_tag_id, row.date) for row in result] \
+           == [(catalog.id, record_tag.id, today + timedelta(days=10))]
+
+    record_tag.data = {'start': str(today + timedelta(days=1)), 'end': '2022-02-30'}
+    record_tag.save()
+    Session.commit()
+    result = Session.execute(select(EmbargoSchedule)).scalars()
+    assert [(row.catalog_id, row.record_tag_id, row.date) for row in result] \
+           == [(catalog.id, record_tag.id, today + timedelta(days=1))]
+
+
+def test_publish_run():
+    catalog = CatalogFactory()
+    now = datetime.now(timezone.utc)
+    publish_run = PublishRun(catalog_ids=[catalog.id], full_scan=True, shard_index=0, shard_count=1, started=now, updated=now,
+                             candidate_count=2, completed_count=0)
+    publish_run.save()
+    PublishRunBatch(run_id=publish_run.id, first_record_id='a', last_record_id='b', record_count=2, completed=now).save()
+    Session.commit()
+    result = Session.execute(select(PublishRun, PublishRunBatch).join(PublishRunBatch)).one()
+    assert (result.PublishRun.catalog_ids, result.PublishRun.finished, result.PublishRunBatch.first_record_id, result.PublishRunBatch.last_record_id) \
+           == ([catalog.id], None, 'a', 'b')
+
+    Session.delete(publish_run)
+    Session.commit()
+    assert Session.execute(select(PublishRunBatch)).first() is None
+
+
 def test_create_record_tag():
     record_tag = RecordTagFactory()
     result = Session.execute(select(RecordTag).join(Record).join(Tag)).scalar_one()
@@ -0,0 +1,363 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select, update
+
+from odp.api.models import PublishedMetadataModel, PublishedSAEONRecordModel
+from odp.api.routers.record import output_record_model
+from odp.db import Session
+from odp.db.models import CatalogFacetCount, CatalogRecord, CatalogRecordQueue, PublishedDOI, PublishRun, Record
+from odp.job.publish import MultiPublisher, Publisher
+from odp.job.publish.datacite import DataCitePublisher
+from odp.job.publish.saeon import SAEONPublisher
+from odplib.const import ODPCollectionTag, ODPMetadataSchema, ODPRecordTag
+from test.factories import (CatalogFactory, CollectionFactory, CollectionTagFactory, RecordFactory, RecordTagFactory, SchemaFactory,
+                            TagFactory)
+
+
+@pytest.mark.parametrize('publisher_cls', [SAEONPublisher, DataCitePublisher])
+@pytest.mark.parametrize('collection_ready, qc, retracted, migrated, valid, has_doi', [
+    (True, [True], False, None, True, True),
+    (False, [True], False, None, True, True),
+    (True, [], False, None, True, True),
+    (True, [False], False, None, True, True),
+    (True, [True, False], False, None, True, True),
+    (True, [True], True, None, True, True),
+    (True, [True], False, None, False, True),
+    (True, [True], False, None, True, False),
+    (False, [True, False], True, None, False, False),
+    (True, [False], True, (True, True), False, True),
+    (True, [True], False, (False, True), True, True),
+    (True, [False], False, (True, False), True, True),
+    (True, [True], False, (False, False), True, True),
+    (False, [], False, (True, True), True, False),
+])
+def test_evaluate_records(publisher_cls, collection_ready, qc, retracted, migrated, valid, has_doi):
+    """Check that the set-based evaluation of universal publication
+    rules agrees with the per-record evaluation.
+
+    :param qc: pass_ values of QC tags
+    :param migrated: None, or a (published, current) tuple, where a current
+        migrated tag is one that is not older than the record
+    """
+    record = RecordFactory(identifiers='doi' if has_doi else 'sid', validity={'valid': valid})
+
+    if collection_ready:
+        CollectionTagFactory(collection=record.collection, tag=TagFactory(id=ODPCollectionTag.READY, type='collection'))
+
+    if qc:
+        qc_tag = TagFactory(id=ODPRecordTag.QC, type='record')
+        for pass_ in qc:
+            RecordTagFactory(record=record, tag=qc_tag, data={'pass_': pass_})
+
+    if retracted:
+        RecordTagFactory(record=record, tag=TagFactory(id=ODPRecordTag.RETRACTED, type='record'))
+
+    if migrated:
+        published, current = migrated
+        RecordTagFactory(
+            record=record,
+            tag=TagFactory(id=ODPRecordTag.MIGRATED, type='record'),
+            data={'published': published},
+            timestamp=record.timestamp if current else record.timestamp - timedelta(days=1),
+        )
+
+    publisher = publisher_cls(CatalogFactory().id)
+    Session.expire_all()
+    record_model = output_record_model(Session.get(Record, record.id))
+
+    can_publish, reasons = publisher.evaluate_record(record_model)
+    evaluation = publisher._evaluate_records([record.id])[record.id]
+    assert (evaluation.can_publish, evaluation.reasons) == (can_publish, [reason.value for reason in reasons])
+
+
+@pytest.mark.parametrize('geo_locations, extent', [
+    ([], None),
+    ([{'geoLocationPlace': 'Cape Town'}], None),
+    ([{'geoLocationPoint': {'pointLatitude': '-33.9', 'pointLongitude': '18.4'}}], (-33.9, 18.4, -33.9, 18.4)),
+    ([{'geoLocationBox': {
+        'northBoundLatitude': -34.0, 'eastBoundLongitude': 18.3,
+        'southBoundLatitude': -34.4, 'westBoundLongitude': 17.9,
+    }}], (-34.0, 18.3, -34.4, 17.9)),
+    ([{'geoLocationBox': {
+        'northBoundLatitude': -34.0, 'eastBoundLongitude': 18.3,
+        'southBoundLatitude': -34.4, 'westBoundLongitude': 17.9,
+    }}, {
+        'geoLocationPoint': {'pointLatitude': -29.1, 'pointLongitude': 26.2},
+    }, {
+        'geoLocationPolygons': [{'polygonPoints': [
+            {'pointLatitude': -22.5, 'pointLongitude': 30.1},
+            {'pointLatitude': -23.0, 'pointLongitude': 31.0},
+            {'pointLatitude': -22.5, 'pointLongitude': 30.1},
+        ]}],
+    }], (-22.5, 31.0, -34.4, 17.9)),
+    ([{'geoLocationBox': {
+        'northBoundLatitude': -15.0, 'eastBoundLongitude': -175.0,
+        'southBoundLatitude': -20.0, 'westBoundLongitude': 177.0,
+    }}], (-15.0, 180.0, -20.0, -180.0)),
+])
+def test_create_spatial_search_data(geo_locations, extent):
+    published_record = PublishedSAEONRecordModel(
+        id='00000000-0000-0000-0000-000000000000',
+        doi=None,
+        sid='test',
+        collection_id='test',
+        metadata=[PublishedMetadataModel(
+            schema_id=ODPMetadataSchema.SAEON_DATACITE_4,
+            metadata={'geoLocations': geo_locations} if geo_locations else {},
+        )],
+        tags=[],
+        timestamp='2022-01-01T00:00:00+00:00',
+    )
+    assert SAEONPublisher('test').create_spatial_search_data(published_record) == extent
+
+
+@pytest.fixture
+def create_record():
+    """Return a function that creates and commits a record, with SAEON DataCite
+    metadata, in a collection that is ready for publication, and returns its
+    output model. The record passes QC unless `qc` is False."""
+    collection = CollectionFactory()
+    CollectionTagFactory(collection=collection, tag=TagFactory(id=ODPCollectionTag.READY, type='collection'))
+    qc_tag = TagFactory(id=ODPRecordTag.QC, type='record')
+    schema = SchemaFactory(
+        id=ODPMetadataSchema.SAEON_DATACITE_4,
+        type='metadata',
+        uri='https://odp.saeon.ac.za/schema/metadata/saeon/datacite-4',
+    )
+
+    def create(title, qc=True, **kwargs):
+        record = RecordFactory(
+            collection=collection,
+            schema=schema,
+            validity={'valid': True},
+            metadata_={
+                'titles': [{'title': title}],
+                'publicationYear': '2022',
+                'subjects': [{'subject': 'rain'}],
+            },
+            **kwargs,
+        )
+        RecordTagFactory(record=record, tag=qc_tag, data={'pass_': qc})
+        return output_record_model(record)
+
+    return create
+
+
+def catalog_record_state(catalog_id):
+    """Return {record_id: catalog_record} for a catalog."""
+    Session.expire_all()
+    return {
+        catalog_record.record_id: catalog_record
+        for catalog_record in Session.execute(
+            select(CatalogRecord).where(CatalogRecord.catalog_id == catalog_id)
+        ).scalars()
+    }
+
+
+def queued_record_ids(catalog_id):
+    return set(Session.execute(
+        select(CatalogRecordQueue.record_id).where(CatalogRecordQueue.catalog_id == catalog_id)
+    ).scalars())
+
+
+def test_publish(create_record):
+    catalog = CatalogFactory()
+    published_1 = create_record('Rainfall', identifiers='doi')
+    published_2 = create_record('Soil moisture', identifiers='sid')
+    hidden = create_record('Ocean', qc=False, identifiers='doi')
+    assert queued_record_ids(catalog.id) == {published_1.id, published_2.id, hidden.id}
+
+    publisher = SAEONPublisher(catalog.id)
+    publisher.run()
+
+    result = catalog_record_state(catalog.id)
+    assert set(result) == {published_1.id, published_2.id, hidden.id}
+    for record in published_1, published_2:
+        assert result[record.id].published is True
+        assert result[record.id].published_record['id'] == record.id
+        assert result[record.id].published_md5
+        assert result[record.id].doi == record.doi
+        assert result[record.id].timestamp >= datetime.fromisoformat(record.timestamp)
+        assert result[record.id].keywords == ['rain']
+        assert 'year:2022' in result[record.id].facets
+    assert result[hidden.id].published is False
+    assert result[hidden.id].published_record is None
+    assert result[hidden.id].reason == 'QC failed'
+    assert result[hidden.id].keywords is None
+
+    assert set(Session.execute(select(PublishedDOI.doi)).scalars()) == {published_1.doi}
+    assert queued_record_ids(catalog.id) == set()
+    assert publisher.counts == dict(selected=3, published=2, hidden=1, failed=0)
+
+    publish_run = Session.execute(select(PublishRun)).scalar_one()
+    assert publish_run.finished is not None
+    assert (publish_run.candidate_count, publish_run.completed_count) == (3, 3)
+
+    facet_counts = {
+        (row.facet, row.value): row.count
+        for row in Session.execute(select(CatalogFacetCount).where(CatalogFacetCount.catalog_id == catalog.id)).scalars()
+    }
+    assert facet_counts[('year', '2022')] == 2
+    assert facet_counts[('keyword', 'rain')] == 2
+
+
+def test_publish_batches(create_record):
+    """Records are published in batches, each of which is committed
+    and journaled in the publish run."""
+    catalog = CatalogFactory()
+    records = [create_record(f'Record {n}') for n in range(5)]
+
+    publisher = SAEONPublisher(catalog.id)
+    multi_publisher = MultiPublisher([publisher])
+    multi_publisher.batch_size = 2
+    multi_publisher.run()
+
+    assert all(catalog_record.published for catalog_record in catalog_record_state(catalog.id).values())
+    assert set(catalog_record_state(catalog.id)) == {record.id for record in records}
+    assert queued_record_ids(catalog.id) == set()
+
+    publish_run = Session.execute(select(PublishRun)).scalar_one()
+    assert [batch.record_count for batch in sorted(publish_run.batches, key=lambda b: b.first_record_id)] == [2, 2, 1]
+    assert publish_run.high_water_mark == max(record.id for record in records)
+
+
+def test_publish_changes_queued_after_selection(create_record):
+    """A change made after a record was selected is left queued."""
+    catalog = CatalogFactory()
+    record = create_record('Rainfall')
+    publisher = SAEONPublisher(catalog.id)
+    select_candidates = publisher._select_candidates
+
+    def select_candidates_then_update(full_scan):
+        candidates = select_candidates(full_scan)
+        Session.execute(
+            update(Record).
+            where(Record.id == record.id).
+            values(timestamp=datetime.now(timezone.utc) + timedelta(minutes=1))
+        )
+        Session.commit()
+        return candidates
+
+    publisher._select_candidates = select_candidates_then_update
+    publisher.run()
+
+    assert catalog_record_state(catalog.id)[record.id].published is True
+    assert queued_record_ids(catalog.id) == {record.id}
+
+
+def test_publish_record_failure(create_record):
+    """A record that fails to publish is left queued, without
+    holding up the rest of its batch."""
+    catalog = CatalogFactory()
+    record = create_record('Rainfall')
+    failing_record = create_record('Broken')
+    create_published_record = SAEONPublisher.create_published_record
+
+    def create_published_record_or_fail(self, record_model):
+        if record_model.id == failing_record.id:
+            raise ValueError('broken')
+        return create_published_record(self, record_model)
+
+    publisher = SAEONPublisher(catalog.id)
+    with patch.object(SAEONPublisher, 'create_published_record', create_published_record_or_fail):
+        publisher.run()
+
+    assert set(catalog_record_state(catalog.id)) == {record.id}
+    assert queued_record_ids(catalog.id) == {failing_record.id}
+    assert publisher.counts == dict(selected=2, published=1, hidden=0, failed=1)
+
+
+def test_publish_unchanged(create_record):
+    """Re-publishing a record whose published form is unchanged does not
+    re-sync it to an external catalog."""
+    catalog = CatalogFactory()
+    record = create_record('Rainfall', identifiers='doi')
+    changed_record = create_record('Ocean', identifiers='doi')
+
+    with patch.object(DataCitePublisher, 'sync_external_record', return_value='md5') as sync_external_record:
+        DataCitePublisher(catalog.id).run()
+        assert sync_external_record.call_count == 2
+
+        record_row = Session.get(Record, changed_record.id)
+        record_row.metadata_ = record_row.metadata_ | {'publicationYear': '2023'}
+        record_row.timestamp = datetime.now(timezone.utc)
+        record_row.save()
+        Session.commit()
+
+        sync_external_record.reset_mock()
+        DataCitePublisher(catalog.id).run(full_scan=True)
+        assert [call.args[0] for call in sync_external_record.call_args_list] == [changed_record.id]
+
+    result = catalog_record_state(catalog.id)
+    assert (result[record.id].synced, result[record.id].external_md5) == (True, 'md5')
+    assert (result[changed_record.id].synced, result[changed_record.id].external_md5) == (True, 'md5')
+    assert result[changed_record.id].published_record['metadata']['publicationYear'] == '2023'
+
+
+def test_publish_sync_error(create_record):
+    """A failed external sync is scheduled for retry with backoff, and
+    no sooner than requested by the external catalog."""
+    catalog = CatalogFactory()
+    record = create_record('Rainfall', identifiers='doi')
+    error = ValueError('unavailable')
+    error.retry_after = 3600
+
+    with patch.object(DataCitePublisher, 'sync_external_record', side_effect=error) as sync_external_record:
+        DataCitePublisher(catalog.id).run()
+        catalog_record = catalog_record_state(catalog.id)[record.id]
+        assert (catalog_record.synced, catalog_record.error, catalog_record.error_count) == (False, repr(error), 1)
+        assert catalog_record.next_attempt_at >= datetime.now(timezone.utc) + timedelta(seconds=3590)
+
+        # not yet due for retry
+        sync_external_record.reset_mock()
+        DataCitePublisher(catalog.id).run()
+        sync_external_record.assert_not_called()
+
+
+def test_publish_multiple_catalogs(create_record):
+    """Each record is loaded and built once per run, and published
+    to every catalog for which it is a candidate."""
+    saeon_catalog = CatalogFactory()
+    datacite_catalog = CatalogFactory()
+    doi_record = create_record('Rainfall', identifiers='doi')
+    sid_record = create_record('Ocean', identifiers='sid')
+
+    with (
+        patch.object(DataCitePublisher, 'sync_external_record', return_value='md5'),
+        patch('odp.job.publish.output_record_model', wraps=output_record_model) as build,
+    ):
+        MultiPublisher([SAEONPublisher(saeon_catalog.id), DataCitePublisher(datacite_catalog.id)]).run()
+
+    assert build.call_count == 2
+
+    saeon_result = catalog_record_state(saeon_catalog.id)
+    assert saeon_result[doi_record.id].published is True
+    assert saeon_result[sid_record.id].published is True
+
+    datacite_result = catalog_record_state(datacite_catalog.id)
+    assert datacite_result[doi_record.id].published is True
+    assert datacite_result[doi_record.id].published_record['doi'] == doi_record.doi
+    assert datacite_result[doi_record.id].synced is True
+    assert datacite_result[sid_record.id].published is False
+    assert datacite_result[sid_record.id].reason == 'no DOI'
+
+    assert queued_record_ids(saeon_catalog.id) == queued_record_ids(datacite_catalog.id) == set()
+
+
+@pytest.mark.parametrize('error_count, retry_after, min_delay, max_delay', [
+    (0, None, 30, 60),
+    (3, None, 240, 480),
+    (10, None, 1800, 3600),
+    (0, 120, 120, 120),
+    (3, 10, 240, 480),
+])
+def test_next_attempt_at(error_count, retry_after, min_delay, max_delay):
+    publisher = Publisher('test')
+    publisher.retry_delay = 60
+    publisher.retry_max_delay = 3600
+    before = datetime.now(timezone.utc)
+    next_attempt_at = publisher._next_attempt_at(error_count, retry_after)
+    after = datetime.now(timezone.utc)
+    assert before + timedelta(seconds=min_delay) <= next_attempt_at <= after + timedelta(seconds=max_delay)